@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import base64
+import fcntl
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import date, timedelta
+
+from bells import local_now
+
+ANALYTICS_PATH = os.getenv('ANALYTICS_PATH', os.path.join('state', 'analytics.json'))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 60))
+# Пользователи по календарным дням хранятся столько дней, остальное удаляется при сбросе.
+ANALYTICS_DAY_RETENTION = int(os.getenv('ANALYTICS_DAY_RETENTION', 90))
+# Память фиксирована: не больше MAX_KEYS счётчиков, по HyperLogLog на группу и на
+# календарный день (2^HLL_PRECISION байт каждый) и гистограмма на каждую минуту суток.
+MAX_KEYS = 5000
+HLL_PRECISION = 10
+MINUTES_PER_DAY = 24 * 60
+OVERFLOW_KEY = '…'
+OVERFLOW_VIEW = (OVERFLOW_KEY, OVERFLOW_KEY)
+
+
+def hash_item(item):
+    # Стабильный между процессами 64-битный хеш (встроенный hash() рандомизирован).
+    return int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    # Оценка числа различных пользователей с погрешностью ~1.04/sqrt(2^precision) (около 3%).
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers or bytes(1 << precision))
+
+    def add(self, item):
+        self.add_hash(hash_item(item))
+
+    def add_hash(self, value):
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for index, rank in enumerate(other.registers):
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_json(self):
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def from_json(cls, data):
+        registers = base64.b64decode(data)
+        return cls(int(math.log2(len(registers))), registers)
+
+
+class Aggregates:
+    # Счётчики событий и просмотров (группа, день), различные пользователи по группам и дням,
+    # нагрузка по минутам суток. Все части складываются: так сливаются воркеры и сбросы на диск.
+    def __init__(self):
+        self.events = Counter()
+        self.views = Counter()
+        self.users = HyperLogLog()
+        self.group_users = {}
+        self.day_users = {}
+        self.minutes = [0] * MINUTES_PER_DAY
+
+    def count(self, counter, key, overflow=OVERFLOW_KEY):
+        if key not in counter and len(counter) >= MAX_KEYS:
+            key = overflow
+        counter[key] += 1
+
+    def sketch(self, sketches, key):
+        if key not in sketches and len(sketches) >= MAX_KEYS:
+            key = OVERFLOW_KEY
+        if key not in sketches:
+            sketches[key] = HyperLogLog()
+        return sketches[key]
+
+    def merge(self, other):
+        for key, value in other.events.items():
+            self.events[key] += value
+        for key, value in other.views.items():
+            self.views[key] += value
+        self.users.merge(other.users)
+        for sketches, others in ((self.group_users, other.group_users), (self.day_users, other.day_users)):
+            for key, sketch in others.items():
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = HyperLogLog(sketch.precision, sketch.registers)
+        self.minutes = [a + b for a, b in zip(self.minutes, other.minutes)]
+
+    def expire_days(self, today, retention=ANALYTICS_DAY_RETENTION):
+        # Ключи day_users — даты ISO; старые даты и ключи прежнего формата (дни недели) удаляются.
+        oldest = today - timedelta(days=retention - 1)
+        for key in list(self.day_users):
+            try:
+                expired = date.fromisoformat(key) < oldest
+            except ValueError:
+                expired = True
+            if expired:
+                del self.day_users[key]
+
+    def to_json(self):
+        return {
+            'events': dict(self.events),
+            'views': {f"{group}|{day}": value for (group, day), value in self.views.items()},
+            'users': self.users.to_json(),
+            'group_users': {key: sketch.to_json() for key, sketch in self.group_users.items()},
+            'day_users': {key: sketch.to_json() for key, sketch in self.day_users.items()},
+            'minutes': self.minutes,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        aggregates = cls()
+        aggregates.events.update(data.get('events', {}))
+        aggregates.views.update({tuple(key.split('|', 1)): value for key, value in data.get('views', {}).items()})
+        if data.get('users'):
+            aggregates.users = HyperLogLog.from_json(data['users'])
+        aggregates.group_users = {key: HyperLogLog.from_json(value) for key, value in data.get('group_users', {}).items()}
+        aggregates.day_users = {key: HyperLogLog.from_json(value) for key, value in data.get('day_users', {}).items()}
+        minutes = data.get('minutes') or []
+        if len(minutes) == MINUTES_PER_DAY:
+            aggregates.minutes = minutes
+        return aggregates
+
+
+class UsageStats:
+    # В памяти копятся только приращения с прошлого сброса; при сбросе они под блокировкой
+    # файла прибавляются к сохранённым итогам, поэтому воркеры gunicorn не затирают друг друга.
+    def __init__(self, path=ANALYTICS_PATH, flush_interval=ANALYTICS_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = Aggregates()
+        self.totals = None
+        self.flusher = None
+
+    def record(self, user_id, kind, group_id=None, day=None, now=None):
+        now = now or local_now()
+        user_hash = hash_item(user_id)
+        with self.lock:
+            pending = self.pending
+            pending.count(pending.events, kind)
+            pending.users.add_hash(user_hash)
+            pending.minutes[now.hour * 60 + now.minute] += 1
+            if group_id:
+                pending.sketch(pending.group_users, group_id).add_hash(user_hash)
+            pending.sketch(pending.day_users, now.date().isoformat()).add_hash(user_hash)
+            if group_id and day:
+                pending.count(pending.views, (group_id, day), OVERFLOW_VIEW)
+        self.start()
+
+    def start(self):
+        # Поток сброса запускается при первом событии, а не при импорте.
+        if self.flusher is None:
+            with self.lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self.run, daemon=True)
+                    self.flusher.start()
+                    atexit.register(self.safe_flush)
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.safe_flush()
+
+    def safe_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Ошибка сохранения статистики: {e}")
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return Aggregates.from_json(json.load(f))
+        except FileNotFoundError:
+            return Aggregates()
+        except (OSError, ValueError) as e:
+            logging.error(f"Не удалось прочитать статистику {self.path}: {e}")
+            return Aggregates()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Aggregates()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            totals = self.load()
+            totals.merge(pending)
+            totals.expire_days(local_now().date())
+            tmp_path = f"{self.path}.part"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(totals.to_json(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        self.totals = totals
+        return totals
+
+    def hottest(self, limit):
+        # Самые просматриваемые пары (группа, день) по сохранённым итогам и свежим приращениям.
+        views = Counter(self.totals.views) if self.totals is not None else self.load().views
+        with self.lock:
+            views.update(self.pending.views)
+        views.pop(OVERFLOW_VIEW, None)
+        return [key for key, _ in views.most_common(limit)]
+
+
+usage = UsageStats()
+
+
+def print_report(totals, top=10):
+    print(f"Различных пользователей: ~{totals.users.estimate()}")
+    print("\nСобытия:")
+    for kind, value in totals.events.most_common(top):
+        print(f"  {value:>8}  {kind}")
+    print("\nСамые просматриваемые (группа, день):")
+    for (group_id, day), value in totals.views.most_common(top):
+        print(f"  {value:>8}  {group_id} — {day}")
+    print("\nПользователей по группам:")
+    for group_id, sketch in sorted(totals.group_users.items(), key=lambda item: -item[1].estimate())[:top]:
+        print(f"  {sketch.estimate():>8}  {group_id}")
+    print("\nПользователей по дням:")
+    for day, sketch in sorted(totals.day_users.items())[-top:]:
+        print(f"  {sketch.estimate():>8}  {day}")
+    print("\nПиковые минуты:")
+    peaks = sorted(range(MINUTES_PER_DAY), key=lambda minute: -totals.minutes[minute])[:top]
+    for minute in sorted(peaks):
+        if totals.minutes[minute]:
+            print(f"  {totals.minutes[minute]:>8}  {minute // 60:02d}:{minute % 60:02d}")
+
+
+if __name__ == "__main__":
+    print_report(UsageStats(sys.argv[1] if len(sys.argv) > 1 else ANALYTICS_PATH).load())
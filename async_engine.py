@@ -0,0 +1,253 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot.util import extract_command
+from telegram import InlineKeyboardMarkup, InlineQueryResultArticle, InputFile, InputTextMessageContent
+from telegram.error import RetryAfter
+from telegram.ext import Application, TypeHandler
+
+import metrics
+
+# Размер пула HTTP-соединений к Bot API: все чаты обслуживает один цикл событий.
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 64))
+# Обработчики синхронные (SQLite, снимки, отрисовка), поэтому идут в ограниченный пул потоков,
+# а не в сам цикл: медленный обработчик не задерживает остальные чаты.
+ASYNC_HANDLER_WORKERS = int(os.getenv('ASYNC_HANDLER_WORKERS', 8))
+API_RETRIES = 3
+API_RETRY_DELAY = 1
+FEED_TIMEOUT = 10
+
+
+class AsyncBotFacade:
+    # Тот же интерфейс, что у telebot.TeleBot для parse_schedule.register_handlers:
+    # обработчики остаются общими, а вызовы API становятся задачами цикла событий
+    # вместо блокирующих запросов с time.sleep между попытками. Методы API вызываются
+    # из потоков обработчиков и передают работу в цикл через call_soon_threadsafe.
+    def __init__(self):
+        self.application = None
+        self.loop = None
+        self.message_handlers = []
+        self.callback_query_handlers = []
+        self.inline_handlers = []
+        self.pending_edits = {}
+        self.edit_tasks = {}
+
+    def message_handler(self, commands=None, content_types=None, func=None):
+        def decorator(handler):
+            self.message_handlers.append((commands, content_types or ['text'], func, handler))
+            return handler
+        return decorator
+
+    def callback_query_handler(self, func=None):
+        def decorator(handler):
+            self.callback_query_handlers.append((func, handler))
+            return handler
+        return decorator
+
+    def inline_handler(self, func=None):
+        def decorator(handler):
+            self.inline_handlers.append((func, handler))
+            return handler
+        return decorator
+
+    def process_update(self, data):
+        # Как в telebot: срабатывает первый обработчик, чьи фильтры подошли.
+        update = telebot.types.Update.de_json(data)
+        if update.message:
+            for commands, content_types, func, handler in self.message_handlers:
+                if update.message.content_type not in content_types:
+                    continue
+                if commands and extract_command(update.message.text or '') not in commands:
+                    continue
+                if func is None or func(update.message):
+                    return handler(update.message)
+        elif update.callback_query:
+            return self.run_first(self.callback_query_handlers, update.callback_query)
+        elif update.inline_query:
+            return self.run_first(self.inline_handlers, update.inline_query)
+
+    def run_first(self, handlers, item):
+        for func, handler in handlers:
+            if func is None or func(item):
+                return handler(item)
+
+    async def call_api(self, make_call, on_error=None):
+        error = None
+        for attempt in range(API_RETRIES):
+            try:
+                return await make_call()
+            except RetryAfter as e:
+                error = e
+                logging.warning(f"Лимит Telegram, пауза {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                error = e
+                logging.error(f"Ошибка API (попытка {attempt+1}): {e}")
+                if attempt < API_RETRIES - 1:
+                    await asyncio.sleep(API_RETRY_DELAY)
+        if on_error is not None:
+            # Обработчик ошибки синхронный, как и сами обработчики, поэтому не в цикле.
+            asyncio.get_running_loop().run_in_executor(None, on_error, error)
+
+    def spawn(self, make_call, chat_id=None):
+        async def call():
+            # Новое сообщение в чат уходит после уже запрошенных правок этого чата.
+            edits = [task for key, task in self.edit_tasks.items() if key[0] == chat_id]
+            if edits:
+                await asyncio.wait(edits)
+            return await self.call_api(make_call)
+
+        self.loop.call_soon_threadsafe(lambda: self.application.create_task(call()))
+        return True
+
+    def keyboard(self, reply_markup):
+        if reply_markup is None:
+            return None
+        return InlineKeyboardMarkup.de_json(reply_markup.to_dict(), self.application.bot)
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        return self.spawn(lambda: self.application.bot.send_message(
+            chat_id=chat_id, text=text, reply_markup=self.keyboard(reply_markup), parse_mode=parse_mode), chat_id)
+
+    def answer_callback_query(self, callback_query_id, text=None, show_alert=None, url=None, cache_time=None):
+        return self.spawn(lambda: self.application.bot.answer_callback_query(
+            callback_query_id, text=text, show_alert=show_alert, url=url, cache_time=cache_time))
+
+    def answer_inline_query(self, inline_query_id, results, cache_time=None):
+        articles = [
+            InlineQueryResultArticle(
+                id=result.id,
+                title=result.title,
+                description=result.description,
+                input_message_content=InputTextMessageContent(
+                    result.input_message_content.message_text,
+                    parse_mode=result.input_message_content.parse_mode)
+            )
+            for result in results
+        ]
+        return self.spawn(lambda: self.application.bot.answer_inline_query(
+            inline_query_id, articles, cache_time=cache_time))
+
+    def send_photo(self, chat_id, photo, caption=None):
+        return self.spawn_upload(self.application.bot.send_photo, chat_id, photo, caption)
+
+    def send_document(self, chat_id, document, caption=None):
+        return self.spawn_upload(self.application.bot.send_document, chat_id, document, caption)
+
+    def spawn_upload(self, send, chat_id, media, caption):
+        # media — file_id строкой или timetable_media.Upload: файл читается (и дорисовывается)
+        # в пуле потоков, после загрузки Upload запоминает file_id.
+        async def call():
+            if isinstance(media, str):
+                return await send(chat_id, media, caption=caption)
+            data = await asyncio.get_running_loop().run_in_executor(None, media.read)
+            if data is None:
+                return None
+            message = await send(chat_id, InputFile(data, filename=media.filename), caption=caption)
+            media.sent(message)
+            return message
+
+        return self.spawn(call, chat_id)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, parse_mode=None,
+                          on_error=None):
+        # Та же замена устаревших правок, что у EditCoalescer, но без потоков: всё в одном цикле.
+        key = (chat_id, message_id)
+        metrics.increment('bot_edits_submitted_total')
+        self.loop.call_soon_threadsafe(self.queue_edit, key, lambda: self.application.bot.edit_message_text(
+            text, chat_id=chat_id, message_id=message_id, reply_markup=self.keyboard(reply_markup),
+            parse_mode=parse_mode), on_error)
+        return True
+
+    def queue_edit(self, key, call, on_error):
+        # Выполняется в цикле событий, поэтому словари правок не нуждаются в блокировке.
+        if key in self.pending_edits:
+            metrics.increment('bot_edits_coalesced_total')
+        self.pending_edits[key] = (call, on_error)
+        if key not in self.edit_tasks:
+            self.edit_tasks[key] = self.application.create_task(self.flush_edits(key))
+
+    async def flush_edits(self, key):
+        try:
+            while key in self.pending_edits:
+                call, on_error = self.pending_edits.pop(key)
+                await self.call_api(call, on_error)
+                metrics.increment('bot_edits_sent_total')
+        finally:
+            self.edit_tasks.pop(key, None)
+
+
+class AsyncEngine:
+    # Цикл событий python-telegram-bot в отдельном потоке. Обновления (словари Bot API
+    # из webhook или long polling) кладутся в очередь приложения; обработчики выполняются
+    # в пуле потоков обработчиков, а запросы к API идут через общий пул соединений.
+    def __init__(self, token, pool_size=ASYNC_POOL_SIZE, handler_workers=ASYNC_HANDLER_WORKERS):
+        self.token = token
+        self.pool_size = pool_size
+        self.handler_workers = handler_workers
+        self.facade = AsyncBotFacade()
+        self.loop = None
+        self.stopped = None
+        self.handlers = None
+        self.ready = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        # Цикл запускается при первом обновлении, а не при импорте; если он не поднялся
+        # или упал, следующее обновление запускает его заново.
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.ready = threading.Event()
+                self.thread = threading.Thread(target=asyncio.run, args=(self.serve(self.ready),), daemon=True)
+                self.thread.start()
+            ready = self.ready
+        ready.wait()
+
+    async def serve(self, ready):
+        try:
+            application = (Application.builder().token(self.token).updater(None)
+                           .connection_pool_size(self.pool_size).pool_timeout(30).build())
+            application.add_handler(TypeHandler(dict, self.handle_update))
+            self.facade.application = application
+            self.stopped = asyncio.Event()
+            self.handlers = ThreadPoolExecutor(max_workers=self.handler_workers, thread_name_prefix='handler')
+            async with application:
+                await application.start()
+                self.loop = self.facade.loop = asyncio.get_running_loop()
+                logging.info(f"Асинхронный движок запущен, пул соединений: {self.pool_size}, "
+                             f"потоков обработчиков: {self.handler_workers}")
+                ready.set()
+                await self.stopped.wait()
+                await application.stop()
+        except Exception as e:
+            logging.error(f"Ошибка асинхронного движка: {e}")
+        finally:
+            self.loop = self.facade.loop = None
+            if self.handlers is not None:
+                self.handlers.shutdown(wait=False)
+            ready.set()
+
+    async def handle_update(self, update, context):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.handlers, self.facade.process_update, update)
+        except Exception as e:
+            logging.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    def feed(self, updates):
+        # Исключение доходит до webhook (ответ 5xx) и long polling (offset не сохраняется),
+        # поэтому Telegram доставит обновления повторно.
+        self.start()
+        loop = self.loop
+        if loop is None:
+            raise RuntimeError(f"асинхронный движок не запущен, не принято обновлений: {len(updates)}")
+        for update in updates:
+            asyncio.run_coroutine_threadsafe(self.facade.application.update_queue.put(update), loop).result(FEED_TIMEOUT)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
@@ -0,0 +1,95 @@
+import os
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+
+# Время колледжа: Минск, UTC+3 без перехода на летнее время.
+SCHEDULE_UTC_OFFSET = float(os.getenv('SCHEDULE_UTC_OFFSET', 3))
+COLLEGE_TZ = timezone(timedelta(hours=SCHEDULE_UTC_OFFSET))
+
+Bell = namedtuple('Bell', ['number', 'start', 'end'])
+
+JUNIOR = 'junior'
+SENIOR = 'senior'
+
+# Звонки одинаковы для всех курсов, кроме 5-го занятия: у 1-2 курса перед ним большой
+# перерыв, у 3-4 курса — после него.
+COMMON_BELLS = [
+    Bell(1, time(8, 30), time(9, 15)),
+    Bell(2, time(9, 25), time(10, 10)),
+    Bell(3, time(10, 20), time(11, 5)),
+    Bell(4, time(11, 15), time(12, 0)),
+    Bell(6, time(13, 50), time(14, 35)),
+    Bell(7, time(14, 45), time(15, 30)),
+    Bell(8, time(15, 40), time(16, 25)),
+    Bell(9, time(16, 35), time(17, 20)),
+    Bell(10, time(17, 30), time(18, 15)),
+]
+FIFTH_BELL = {
+    JUNIOR: Bell(5, time(12, 55), time(13, 40)),
+    SENIOR: Bell(5, time(12, 10), time(12, 55)),
+}
+
+# Явное указание курса для групп, чей номер не подчиняется правилу «первая цифра — курс»,
+# например GROUP_COURSES="8ТО:1,245:3".
+GROUP_COURSES = dict(
+    item.split(':', 1) for item in os.getenv('GROUP_COURSES', '').replace(' ', '').split(',') if ':' in item
+)
+
+
+def local_now():
+    return datetime.now(COLLEGE_TZ)
+
+
+def bell_schedule(course_group=JUNIOR):
+    return sorted(COMMON_BELLS + [FIFTH_BELL[course_group]], key=lambda bell: bell.number)
+
+
+# Таблицы звонков и отсортированные начала занятий для бинарного поиска, по одной на курс.
+BELL_TABLES = {
+    course_group: (bells, [bell.start for bell in bells])
+    for course_group, bells in ((course_group, bell_schedule(course_group)) for course_group in FIFTH_BELL)
+}
+
+
+def bells_at(moment, course_group=JUNIOR):
+    # Текущее занятие (None на перемене и вне занятий) и следующее за моментом.
+    bells, starts = BELL_TABLES[course_group]
+    clock = moment.time().replace(tzinfo=None)
+    index = bisect_right(starts, clock) - 1
+    current = bells[index] if index >= 0 and clock < bells[index].end else None
+    upcoming = bells[index + 1:]
+    return current, upcoming
+
+
+def course_for_group(group_id):
+    group_id = group_id.strip()
+    if group_id in GROUP_COURSES:
+        return int(GROUP_COURSES[group_id])
+    match = re.match(r'^(\d)\d{2,}$', group_id)
+    if match and 1 <= int(match.group(1)) <= 4:
+        return int(match.group(1))
+    return None
+
+
+def course_group_for(group_id):
+    course = course_for_group(group_id)
+    return SENIOR if course and course >= 3 else JUNIOR
+
+
+def format_time(value):
+    return f"{value.hour}:{value.minute:02d}"
+
+
+def format_bells_html():
+    def line(bell, suffix=""):
+        return f"<b>{bell.number} Занятие{suffix}</b>: {format_time(bell.start)} - {format_time(bell.end)}"
+
+    parts = ["<b>🔔 Расписание звонков 🔔</b>"]
+    parts += [line(bell) for bell in COMMON_BELLS if bell.number < 5]
+    parts.append("<b>* Большой перерыв (1-2 курс)</b>")
+    parts.append(line(FIFTH_BELL[JUNIOR], " (1-2 курс)") + "\n" + line(FIFTH_BELL[SENIOR], " (3-4 курс)"))
+    parts.append("<b>* Большой перерыв (3-4 курс)</b>")
+    parts += [line(bell) for bell in COMMON_BELLS if bell.number > 5]
+    return "\n\n".join(parts)
@@ -0,0 +1,84 @@
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_model import DaySchedule, LessonPool, format_lesson  # noqa: E402
+
+# Реалистичный объём: ~100 групп, 6 дней, 8 пар, несколько десятков предметов и ~150 кабинетов.
+GROUPS = 100
+DAYS = 6
+LESSONS_PER_DAY = 8
+SUBJECTS = 60
+ROOMS = 150
+
+
+def fresh(text):
+    # Новая строка с тем же содержимым, как при разборе очередного файла.
+    return ''.join(list(text))
+
+
+def generate_days(days, groups, seed=1):
+    rng = random.Random(seed)
+    subjects = [f"Предмет {i} {'(лаб.)' if i % 7 == 0 else ''}".strip() for i in range(SUBJECTS)]
+    rooms = [str(100 + i) for i in range(ROOMS)] + [f"{100 + i}/{200 + i}" for i in range(20)]
+    group_ids = [str(401 + i) for i in range(groups)]
+    for day in range(days):
+        day_groups = {}
+        for group in group_ids:
+            lessons = []
+            for _ in range(LESSONS_PER_DAY):
+                if rng.random() < 0.2:
+                    lessons.append(('', ''))
+                else:
+                    lessons.append((fresh(rng.choice(subjects)), fresh(rng.choice(rooms))))
+            day_groups[fresh(group)] = lessons
+        yield f"day-{day}", day_groups
+
+
+def build_legacy(days, groups):
+    # Текущее представление: словарь дней -> словарь групп -> список отформатированных строк.
+    result = {}
+    for day, day_groups in generate_days(days, groups):
+        result[day] = {group: [format_lesson(subject, rooms) for subject, rooms in lessons]
+                       for group, lessons in day_groups.items()}
+    return result
+
+
+def build_compact(days, groups):
+    pool = LessonPool()
+    return {day: DaySchedule.from_groups(pool, None, day_groups) for day, day_groups in generate_days(days, groups)}
+
+
+def measure(builder, days, groups):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    data = builder(days, groups)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del data
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение памяти: словарь строк против компактной модели расписания")
+    parser.add_argument('--groups', type=int, default=GROUPS)
+    parser.add_argument('--days', type=int, default=DAYS)
+    args = parser.parse_args()
+
+    print(f"{'масштаб':<12}{'уроков':>10}{'dict строк, КБ':>18}{'компактно, КБ':>18}{'выигрыш':>10}")
+    for label, factor in (("реальный", 1), ("10x", 10)):
+        days = args.days * factor
+        lessons = days * args.groups * LESSONS_PER_DAY
+        legacy = measure(build_legacy, days, args.groups)
+        compact = measure(build_compact, days, args.groups)
+        print(f"{label:<12}{lessons:>10}{legacy / 1024:>18.1f}{compact / 1024:>18.1f}{legacy / compact:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import date, datetime, timedelta
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HISTORY_PATH = os.path.join(ROOT, 'benchmarks', 'pipeline_history.jsonl')
+STAGES = ('download', 'extract', 'index')
+PAGE_PATH = "obuchayushhimsya/raspisanie-zanyatij/"
+
+# Синтетический корпус, если нет настоящих документов: расписание псевдографикой
+# в абзацах и те же занятия настоящими таблицами Word, сохранённые libreoffice в старый
+# формат .doc, как на сайте колледжа. Так этап извлечения проходит и конвертацию
+# libreoffice, и разбор таблиц.
+SUBJECTS = ['Математика', 'Физика', 'Химия', 'Информатика', 'История', 'Физ. культура',
+            'Англ. язык/Нем. язык', 'Электротехника', 'Черчение', 'Литература']
+GROUPS = 60
+LESSONS_PER_DAY = 8
+BLOCK = 6
+
+
+def schedule_lines(day, groups, rng):
+    lines = [f"Расписание занятий на {day.strftime('%d.%m.%Y')}"]
+    for i in range(0, len(groups), BLOCK):
+        block = groups[i:i + BLOCK]
+        lines.append('│' + '│'.join(block) + '│')
+        lines.append('├' + '┼'.join('───' for _ in block) + '┤')
+        for number in range(1, LESSONS_PER_DAY + 1):
+            cells = []
+            for _ in block:
+                if rng.random() < 0.2:
+                    cells.append('')
+                else:
+                    rooms = str(rng.randint(100, 420))
+                    if rng.random() < 0.2:
+                        rooms += f"/{rng.randint(100, 420)}"
+                    cells.append(f"{number} {rng.choice(SUBJECTS)} {rooms}")
+            lines.append('│' + '│'.join(cells) + '│')
+        lines.append('└' + '┴'.join('───' for _ in block) + '┘')
+    return lines
+
+
+def schedule_dates(count, today=None):
+    # Рабочие дни (пн-сб), начиная с понедельника текущей недели: эта и следующая неделя.
+    today = today or date.today()
+    day = today - timedelta(days=today.weekday())
+    dates = []
+    while len(dates) < count:
+        if day.weekday() <= 5:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def add_tables(document, lines):
+    # Каждый блок групп ещё и таблицей Word: строка групп, затем строки занятий.
+    rows = []
+    for line in lines:
+        if line.startswith('│'):
+            rows.append(line.split('│')[1:-1])
+        elif line.startswith('└') and rows:
+            table = document.add_table(rows=len(rows), cols=len(rows[0]))
+            for row, cells in zip(table.rows, rows):
+                for cell, text in zip(row.cells, cells):
+                    cell.text = text
+            rows = []
+
+
+def convert_to_doc(docx_dir):
+    if not shutil.which('libreoffice'):
+        raise SystemExit("Для синтетического корпуса .doc нужен libreoffice. Укажите --corpus с настоящими "
+                         "документами или --format docx (без конвертации, этап libreoffice не измеряется).")
+    names = sorted(f for f in os.listdir(docx_dir) if f.endswith('.docx'))
+    subprocess.run(['libreoffice', '--headless', '--convert-to', 'doc', '--outdir', docx_dir]
+                   + [os.path.join(docx_dir, name) for name in names],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=600)
+    for name in names:
+        os.remove(os.path.join(docx_dir, name))
+    if len([f for f in os.listdir(docx_dir) if f.endswith('.doc')]) != len(names):
+        raise SystemExit("libreoffice сохранил в .doc не все документы корпуса")
+
+
+def generate_corpus(corpus_dir, count, groups, legacy=True, seed=1):
+    from docx import Document
+
+    rng = random.Random(seed)
+    group_ids = [str(401 + i) for i in range(groups - 3)] + ['8ТО', '9ТО', '10ТО']
+    os.makedirs(corpus_dir, exist_ok=True)
+    for index, day in enumerate(schedule_dates(count)):
+        document = Document()
+        lines = schedule_lines(day, group_ids, rng)
+        for line in lines:
+            document.add_paragraph(line)
+        add_tables(document, lines)
+        document.save(os.path.join(corpus_dir, f"corpus_{index:02d}.docx"))
+    if legacy:
+        convert_to_doc(corpus_dir)
+
+
+def check_run(stages, corpus_dir):
+    # Прогон, в котором этап извлечения ничего не извлёк или не запустил libreoffice для .doc,
+    # ничего не измерил: результат не пишется в историю.
+    legacy = any(f.endswith('.doc') for f in os.listdir(corpus_dir))
+    extract = stages['extract']
+    if not extract.get('texts'):
+        raise SystemExit(f"Этап извлечения не создал ни одного текста (код выхода {extract['exit_code']})")
+    if legacy and not extract['subprocesses']:
+        raise SystemExit("В корпусе есть .doc, но этап извлечения не запустил ни одного подпроцесса: "
+                         "конвертация libreoffice не измерена")
+    if not legacy:
+        print("Внимание: в корпусе только .docx, конвертация libreoffice не измеряется")
+
+
+def build_site(site_dir, corpus_dir):
+    # Страница в том же виде, что на сайте колледжа: ссылки на документы с датой в имени.
+    files = sorted(f for f in os.listdir(corpus_dir) if f.endswith(('.doc', '.docx')))
+    page_dir = os.path.join(site_dir, PAGE_PATH)
+    files_dir = os.path.join(page_dir, 'files')
+    os.makedirs(files_dir, exist_ok=True)
+    links = []
+    for name, day in zip(files, schedule_dates(len(files))):
+        served_name = f"rasp_{day.strftime('%d.%m.%Y')}{os.path.splitext(name)[1]}"
+        shutil.copyfile(os.path.join(corpus_dir, name), os.path.join(files_dir, served_name))
+        links.append(f'<li><a href="files/{served_name}">Расписание на {day.strftime("%d.%m.%Y")}</a></li>')
+    with open(os.path.join(page_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f"<html><body><h1>Расписание занятий</h1><ul>{''.join(links)}</ul></body></html>")
+    return len(links)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(site_dir):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=site_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/{PAGE_PATH}"
+
+
+def run_stage(stage, work_dir, url):
+    # Выполняется в отдельном процессе: считает порождённые подпроцессы (libreoffice и т.п.).
+    import logging
+    logging.disable(logging.CRITICAL)
+    spawned = [0]
+    original_init = subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        spawned[0] += 1
+        original_init(self, *args, **kwargs)
+
+    subprocess.Popen.__init__ = counting_init
+    downloaded_dir = os.path.join(work_dir, 'downloaded_schedules')
+    extracted_dir = os.path.join(work_dir, 'extracted_schedules')
+    details = {}
+    if stage == 'download':
+        from get_schedule import download_schedules_from_site
+        download_schedules_from_site(url, downloaded_dir)
+        details['documents'] = len(os.listdir(downloaded_dir))
+    elif stage == 'extract':
+        import extract_schedule
+        try:
+            extract_schedule.main(downloaded_dir, extracted_dir)
+        except SystemExit as e:
+            details['exit_code'] = e.code
+        details['texts'] = len(os.listdir(extracted_dir))
+    elif stage == 'index':
+        from parse_schedule import DAYS_ORDER
+        from search_index import SnapshotSearch
+        from shared_snapshot import write_mapped_schedule
+        from snapshot_store import Snapshot
+        snapshot = Snapshot.load(None, extracted_dir)
+        write_mapped_schedule(snapshot, os.path.join(work_dir, 'schedule.bin'))
+        search = SnapshotSearch(snapshot, DAYS_ORDER)
+        details.update(days=len(snapshot.days), groups=len(snapshot.groups), search_keys=len(search.index))
+    details['subprocesses'] = spawned[0]
+    return details
+
+
+def measure_stage(stage, work_dir, url):
+    result_path = os.path.join(work_dir, f"{stage}.json")
+    env = dict(os.environ, SCHEDULE_ARCHIVE_DIR=os.path.join(work_dir, 'archive'), SOURCES_CONFIG=os.devnull)
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--stage', stage, '--work', work_dir, '--url', url,
+         '--result', result_path],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 возвращает ресурсы процесса этапа вместе с его завершёнными потомками.
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+    details = {}
+    if os.path.exists(result_path):
+        with open(result_path, 'r', encoding='utf-8') as f:
+            details = json.load(f)
+    return dict(details, wall_s=round(wall, 3), cpu_s=round(usage.ru_utime + usage.ru_stime, 3),
+                peak_rss_mb=round(usage.ru_maxrss / 1024, 1), exit_code=details.get('exit_code', process.returncode))
+
+
+def run_pipeline(url):
+    work_dir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    try:
+        return {stage: measure_stage(stage, work_dir, url) for stage in STAGES}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_run(run):
+    print(f"{'этап':<10}{'время, с':>10}{'CPU, с':>10}{'RSS, МБ':>10}{'подпроц.':>10}")
+    for stage in STAGES:
+        s = run['stages'][stage]
+        print(f"{stage:<10}{s['wall_s']:>10.2f}{s['cpu_s']:>10.2f}{s['peak_rss_mb']:>10.1f}{s['subprocesses']:>10}")
+    print(f"{'всего':<10}{run['total_wall_s']:>10.2f}{run['total_cpu_s']:>10.2f}")
+
+
+def print_comparison(history):
+    # Последний прогон каждой метки: так видно последовательный режим рядом с более быстрыми.
+    latest = {}
+    for run in history:
+        latest[run['label']] = run
+    print(f"\n{'метка':<16}{'документов':>12}{'время, с':>10}{'CPU, с':>10}{'дата':>22}")
+    for label, run in latest.items():
+        print(f"{label:<16}{run['documents']:>12}{run['total_wall_s']:>10.2f}{run['total_cpu_s']:>10.2f}{run['started_at']:>22}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвейер скачивание → извлечение → индекс на локальной копии сайта")
+    parser.add_argument('--corpus', help="папка с настоящими .doc/.docx; без неё создаётся синтетический корпус")
+    parser.add_argument('--documents', type=int, default=12, help="размер синтетического корпуса (две недели)")
+    parser.add_argument('--format', choices=('doc', 'docx'), default='doc',
+                        help="формат синтетического корпуса; doc требует libreoffice")
+    parser.add_argument('--groups', type=int, default=GROUPS)
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--label', default='sequential', help="имя режима для сравнения в истории")
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--work', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        details = run_stage(args.stage, args.work, args.url)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(details, f)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='bench-site-') as temp_dir:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = os.path.join(temp_dir, 'corpus')
+            generate_corpus(corpus_dir, args.documents, args.groups, legacy=args.format == 'doc')
+        site_dir = os.path.join(temp_dir, 'site')
+        documents = build_site(site_dir, corpus_dir)
+        server, url = serve(site_dir)
+        print(f"Локальный сайт: {url} ({documents} документов)")
+        try:
+            for index in range(args.runs):
+                started_at = datetime.now().isoformat(timespec='seconds')
+                stages = run_pipeline(url)
+                check_run(stages, corpus_dir)
+                run = {
+                    'label': args.label,
+                    'started_at': started_at,
+                    'documents': documents,
+                    'corpus': f"synthetic-{args.format}" if not args.corpus else os.path.abspath(args.corpus),
+                    'stages': stages,
+                    'total_wall_s': round(sum(s['wall_s'] for s in stages.values()), 3),
+                    'total_cpu_s': round(sum(s['cpu_s'] for s in stages.values()), 3),
+                }
+                print(f"\nПрогон {index + 1}/{args.runs} ({args.label}):")
+                print_run(run)
+                with open(args.history, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(run, ensure_ascii=False) + '\n')
+        finally:
+            server.shutdown()
+    print_comparison(load_history(args.history))
+
+
+if __name__ == "__main__":
+    main()
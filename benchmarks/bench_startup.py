@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули конвейера обновления: процесс бота не должен загружать их при старте.
+PIPELINE_MODULES = ('bs4', 'docx', 'lxml')
+IMPORT_BUDGET_MS = 600
+STARTUP_BUDGET_MS = 2500
+
+SERVER_CODE = """
+import sys
+from werkzeug.serving import make_server
+from wsgi import application
+make_server('127.0.0.1', int(sys.argv[1]), application, threaded=True).serve_forever()
+"""
+
+
+def isolated_env(state_dir):
+    # Снимки, пользователи и аренда лидера во временной папке, чтобы не трогать рабочие данные.
+    env = dict(os.environ)
+    env.setdefault('BOT_TOKEN', '1:benchmark')
+    env.update({
+        'SNAPSHOTS_DIR': os.path.join(state_dir, 'snapshots'),
+        'USER_STORE_PATH': os.path.join(state_dir, 'users.sqlite3'),
+        'UPDATES_OFFSET_PATH': os.path.join(state_dir, 'update_offset'),
+        'LEADER_LEASE_PATH': os.path.join(state_dir, 'leader.sqlite3'),
+        'SOURCES_CONFIG': os.path.join(state_dir, 'sources.json'),
+    })
+    return env
+
+
+def parse_importtime(stderr):
+    # Строки вида "import time:   self [us] | cumulative | imported package".
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+    return modules
+
+
+def measure_imports(env, module='main'):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} завершился с ошибкой:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+    total_us = next(cumulative for _, cumulative, name in modules if name == module)
+    return total_us / 1000, modules
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env, path, timeout=30):
+    # От запуска интерпретатора до первого ответа 200: импорт, загрузка снимка, сборка ответа.
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVER_CODE, str(port)], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    response.read()
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None:
+                    raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+                time.sleep(0.01)
+        raise RuntimeError(f"Нет ответа от {path} за {timeout} с")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта и холодного старта процесса бота")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--import-budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--startup-budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--path', default='/api/groups', help="запрос, ответ на который считается первым")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = isolated_env(state_dir)
+        import_times = []
+        modules = []
+        for _ in range(args.repeat):
+            total_ms, modules = measure_imports(env)
+            import_times.append(total_ms)
+        startup_times = [measure_first_request(env, args.path) for _ in range(args.repeat)]
+
+    import_ms = statistics.median(import_times)
+    startup_ms = statistics.median(startup_times)
+    loaded = {name for _, _, name in modules}
+    leaked = [name for name in PIPELINE_MODULES if name in loaded]
+
+    print("Самые долгие импорты (последний прогон, накопительно):")
+    for self_us, cumulative_us, name in sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:>8.1f} мс  {name}")
+    print(f"import main:        {import_ms:>8.1f} мс (бюджет {args.import_budget_ms:.0f} мс)")
+    print(f"первый ответ {args.path}: {startup_ms:>8.1f} мс (бюджет {args.startup_budget_ms:.0f} мс)")
+
+    failed = False
+    if leaked:
+        print(f"❌ Процесс бота импортирует модули конвейера: {', '.join(leaked)}")
+        failed = True
+    if import_ms > args.import_budget_ms:
+        print("❌ Превышен бюджет времени импорта")
+        failed = True
+    if startup_ms > args.startup_budget_ms:
+        print("❌ Превышен бюджет холодного старта")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ В пределах бюджета")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import re
+import time
+import queue
+import logging
+import threading
+
+from telebot.apihelper import ApiTelegramException
+
+from bells import local_now
+
+MINUTES_PER_DAY = 24 * 60
+# Ниже общего лимита Telegram (~30 сообщений в секунду), чтобы оставить запас интерактивным ответам.
+DIGEST_RATE = float(os.getenv('DIGEST_RATE', 20))
+# Если процесс стоял дольше, пропущенные минуты догоняются, но не больше этого окна.
+CATCH_UP_MINUTES = 10
+
+
+def parse_digest_time(text):
+    match = re.fullmatch(r'\s*(\d{1,2})[:.](\d{2})\s*', text or '')
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def format_minute(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def minute_of_day(now):
+    return now.hour * 60 + now.minute
+
+
+class DigestWheel:
+    # Колесо на сутки: ячейка на каждую минуту, в ячейке — подписчики на это время.
+    # Выборка очередной минуты — O(число получателей), без перебора всех подписок.
+    def __init__(self):
+        self.slots = [set() for _ in range(MINUTES_PER_DAY)]
+        self.minutes = {}
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def schedule(self, user_id, minute):
+        self.cancel(user_id)
+        self.slots[minute].add(user_id)
+        self.minutes[user_id] = minute
+
+    def cancel(self, user_id):
+        minute = self.minutes.pop(user_id, None)
+        if minute is not None:
+            self.slots[minute].discard(user_id)
+
+    def due(self, minute):
+        return list(self.slots[minute % MINUTES_PER_DAY])
+
+
+class RenderCache:
+    # Готовый текст на (группа, день) для текущего снимка каждого источника:
+    # все подписчики одной группы получают одну и ту же отрисовку.
+    def __init__(self):
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, source_key, snapshot, key, render):
+        with self.lock:
+            generation = self.generations.get(source_key)
+            if generation is None or generation[0] is not snapshot:
+                generation = (snapshot, {})
+                self.generations[source_key] = generation
+            entries = generation[1]
+            if key not in entries:
+                entries[key] = render()
+            return entries[key]
+
+
+class RateLimitedSender:
+    # Очередь доставки с равномерным темпом: пачка из тысяч рассылок на 20:00 растягивается
+    # на несколько минут и не мешает ответам на нажатия кнопок.
+    def __init__(self, deliver, rate=DIGEST_RATE, on_forbidden=None):
+        self.deliver = deliver
+        self.interval = 1 / max(rate, 0.1)
+        self.on_forbidden = on_forbidden
+        self.queue = queue.Queue()
+        self.next_slot = 0.0
+        self.sent = 0
+
+    def submit_batch(self, user_ids):
+        for user_id in user_ids:
+            self.queue.put(user_id)
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def send_one(self, user_id, stop_event):
+        while not stop_event.is_set():
+            delay = self.next_slot - time.monotonic()
+            if delay > 0:
+                stop_event.wait(delay)
+            self.next_slot = max(self.next_slot, time.monotonic()) + self.interval
+            try:
+                self.deliver(user_id)
+                self.sent += 1
+                return
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 5)
+                    logging.warning(f"Дайджест: лимит Telegram, пауза {retry_after} с")
+                    self.next_slot = time.monotonic() + retry_after
+                    continue
+                if e.error_code == 403 and self.on_forbidden:
+                    logging.info(f"Дайджест: пользователь {user_id} заблокировал бота, подписка снята")
+                    self.on_forbidden(user_id)
+                    return
+                logging.error(f"Дайджест: ошибка отправки пользователю {user_id}: {e}")
+                return
+            except Exception as e:
+                logging.error(f"Дайджест: ошибка отправки пользователю {user_id}: {e}")
+                return
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                user_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.send_one(user_id, stop_event)
+
+
+class DigestScheduler:
+    # Подписки хранятся в хранилище пользователей (значение "ЧЧ:ММ"), колесо в памяти
+    # перестраивается, когда таблицу изменил другой процесс (data_version у SQLite).
+    def __init__(self, store, render):
+        self.store = store
+        self.render = render
+        self.wheel = DigestWheel()
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.last_minute = None
+        self.sender = None
+
+    def reload(self):
+        # Обычный словарь живёт только в этом процессе: его достаточно прочитать один раз.
+        version = self.store.data_version() if hasattr(self.store, 'data_version') else 'memory'
+        if version == self.data_version:
+            return
+        wheel = DigestWheel()
+        for user_id, value in list(self.store.items()):
+            minute = parse_digest_time(value)
+            if minute is not None:
+                wheel.schedule(user_id, minute)
+        with self.lock:
+            self.wheel = wheel
+            self.data_version = version
+        logging.info(f"Дайджест: подписок {len(wheel)}")
+
+    def subscribe(self, user_id, minute):
+        self.store[user_id] = format_minute(minute)
+        with self.lock:
+            self.wheel.schedule(user_id, minute)
+
+    def unsubscribe(self, user_id):
+        self.store.pop(user_id, None)
+        with self.lock:
+            self.wheel.cancel(user_id)
+
+    def subscription(self, user_id):
+        return parse_digest_time(self.store.get(user_id))
+
+    def deliver(self, user_id, send):
+        text = self.render(user_id)
+        if text:
+            send(user_id, text)
+
+    def tick(self, now=None):
+        # Все минуты с прошлого тика: после паузы процесса рассылки не теряются.
+        current = minute_of_day(now or local_now())
+        if self.last_minute is None:
+            self.last_minute = (current - 1) % MINUTES_PER_DAY
+        missed = (current - self.last_minute) % MINUTES_PER_DAY
+        due = []
+        with self.lock:
+            for offset in range(max(0, missed - CATCH_UP_MINUTES) + 1, missed + 1):
+                due += self.wheel.due(self.last_minute + offset)
+        self.last_minute = current
+        if due:
+            logging.info(f"Дайджест: {len(due)} рассылок на {format_minute(current)}")
+            self.sender.submit_batch(due)
+        return due
+
+    def run(self, send, should_run=None, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        should_run = should_run or (lambda: True)
+        self.sender = RateLimitedSender(lambda user_id: self.deliver(user_id, send), on_forbidden=self.unsubscribe)
+        threading.Thread(target=self.sender.run, args=(stop_event,), daemon=True).start()
+        while not stop_event.is_set():
+            now = local_now()
+            if should_run():
+                try:
+                    self.reload()
+                    self.tick(now)
+                except Exception as e:
+                    logging.error(f"Ошибка планировщика дайджестов: {e}")
+            else:
+                self.last_minute = None
+            stop_event.wait(60 - now.second - now.microsecond / 1e6 + 0.05)
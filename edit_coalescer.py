@@ -0,0 +1,89 @@
+import os
+import queue
+import logging
+import threading
+
+import metrics
+
+EDIT_WORKERS = int(os.getenv('EDIT_WORKERS', 4))
+EDIT_WAIT_TIMEOUT = 30
+
+metrics.describe('bot_edits_submitted_total', "Правки сообщений, запрошенные обработчиками")
+metrics.describe('bot_edits_sent_total', "Правки сообщений, отправленные в Bot API")
+metrics.describe('bot_edits_coalesced_total', "Сэкономленные вызовы API: правки, заменённые более новыми")
+
+
+class EditCoalescer:
+    # Очередь правок по ключу (chat_id, message_id): пока правка ждёт отправки, новая правка
+    # того же сообщения просто заменяет её. Правки одного сообщения никогда не уходят
+    # параллельно, поэтому более старая не может перезаписать более новую.
+    def __init__(self, workers=EDIT_WORKERS):
+        self.workers = workers
+        self.pending = {}
+        self.in_flight = set()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.started = False
+
+    def start(self):
+        # Потоки запускаются при первой правке, а не при импорте.
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for _ in range(self.workers):
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, key, call, on_error=None):
+        # on_error(e) вызывается в отдельном потоке, если правка так и не отправилась;
+        # у заменённой более новой правки он не вызывается.
+        self.start()
+        metrics.increment('bot_edits_submitted_total')
+        with self.lock:
+            if key in self.pending:
+                metrics.increment('bot_edits_coalesced_total')
+            elif key not in self.in_flight:
+                self.queue.put(key)
+            self.pending[key] = (call, on_error)
+
+    def busy(self, chat_id):
+        return any(key[0] == chat_id for key in self.pending) or any(key[0] == chat_id for key in self.in_flight)
+
+    def wait_chat(self, chat_id, timeout=EDIT_WAIT_TIMEOUT):
+        # Новое сообщение в чат уходит только после уже запрошенных правок этого чата.
+        with self.idle:
+            if not self.idle.wait_for(lambda: not self.busy(chat_id), timeout):
+                logging.warning(f"Правки чата {chat_id} не отправлены за {timeout} с, сообщение уходит без ожидания")
+
+    def run(self):
+        while True:
+            key = self.queue.get()
+            with self.lock:
+                call, on_error = self.pending.pop(key, (None, None))
+                if call is None:
+                    continue
+                self.in_flight.add(key)
+            error = None
+            try:
+                call()
+                metrics.increment('bot_edits_sent_total')
+            except Exception as e:
+                error = e
+                logging.error(f"Ошибка отправки правки сообщения {key}: {e}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(key)
+                    # Пока правка отправлялась, пришла более новая — её очередь.
+                    if key in self.pending:
+                        self.queue.put(key)
+                    self.idle.notify_all()
+            if error is not None and on_error is not None:
+                # Не в потоке очереди: обработчик ошибки сам может ждать правок этого чата.
+                threading.Thread(target=self.report, args=(key, on_error, error), daemon=True).start()
+
+    def report(self, key, on_error, error):
+        try:
+            on_error(error)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика неудачной правки {key}: {e}")
@@ -4,10 +4,17 @@ import re
 import subprocess
 import tempfile
 import shutil
-from docx import Document
 import logging
+from schedule_archive import EXTRACT_ATTEMPTS, ScheduleArchive, file_sha256
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Свой профиль libreoffice у каждого источника: два экземпляра с общим профилем не работают параллельно.
+LIBREOFFICE_PROFILE_DIR = os.getenv('LIBREOFFICE_PROFILE_DIR')
+
+def libreoffice_command(*args):
+    command = ['libreoffice']
+    if LIBREOFFICE_PROFILE_DIR:
+        command.append(f"-env:UserInstallation=file://{os.path.abspath(LIBREOFFICE_PROFILE_DIR)}")
+    return command + list(args)
 
 def convert_doc_to_docx(doc_path, temp_dir):
     try:
@@ -34,7 +41,7 @@ def convert_doc_to_docx(doc_path, temp_dir):
             return None
 
         test_result = subprocess.run(
-            ['libreoffice', '--headless', '--convert-to', 'txt', '/app/README.md', '--outdir', temp_dir],
+            libreoffice_command('--headless', '--convert-to', 'txt', '/app/README.md', '--outdir', temp_dir),
             capture_output=True, text=True, timeout=30
         )
         logging.debug(f"Тестовая конверсия README.md: stdout={test_result.stdout}, stderr={test_result.stderr}, returncode={test_result.returncode}")
@@ -42,7 +49,7 @@ def convert_doc_to_docx(doc_path, temp_dir):
         logging.debug(f"Выполняем команду: libreoffice --headless --convert-to docx {doc_path} --outdir {temp_dir}")
         try:
             result = subprocess.run(
-                ['libreoffice', '--headless', '--convert-to', 'docx', doc_path, '--outdir', temp_dir],
+                libreoffice_command('--headless', '--convert-to', 'docx', doc_path, '--outdir', temp_dir),
                 capture_output=True, text=True, timeout=60
             )
             logging.debug(f"Тип объекта result: {type(result)}")
@@ -90,6 +97,8 @@ def extract_doc_to_txt(doc_path, txt_path):
                 raise RuntimeError(f"Не удалось конвертировать {doc_path} в .docx")
 
         try:
+            from docx import Document
+
             doc = Document(temp_docx_path)
             logging.info(f"Открыт файл: {temp_docx_path}")
             for para in doc.paragraphs:
@@ -143,9 +152,11 @@ def extract_doc_to_txt(doc_path, txt_path):
             return False
 
         os.makedirs(os.path.dirname(txt_path), exist_ok=True)
-        with open(txt_path, 'w', encoding='utf-8') as txt_file:
+        tmp_txt_path = f"{txt_path}.part"
+        with open(tmp_txt_path, 'w', encoding='utf-8') as txt_file:
             for line in text_lines:
                 txt_file.write(line + '\n')
+        os.replace(tmp_txt_path, txt_path)
         logging.info(f"Текст успешно извлечён из {doc_path} и сохранён в {txt_path}")
 
         if os.path.exists(txt_path):
@@ -163,9 +174,32 @@ def extract_doc_to_txt(doc_path, txt_path):
         logging.error(f"Ошибка при обработке {doc_path}: {e}")
         return False
 
-def main():
-    downloaded_dir = "downloaded_schedules"
-    extracted_dir = "extracted_schedules"
+def extract_archive_documents(archive, skip=()):
+    # skip — документы, которые уже пробовали конвертировать в этом запуске.
+    success_count = 0
+    error_count = 0
+    pending = [(key, entry) for key, entry in archive.pending_documents() if entry['doc'] not in skip]
+    if not pending:
+        return success_count, error_count
+    logging.info(f"В архиве {len(pending)} документов без извлечённого текста")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for key, entry in pending:
+            doc_path = archive.object_path(entry['doc'], entry['ext'])
+            txt_path = os.path.join(temp_dir, f"{key}.txt")
+            if extract_doc_to_txt(doc_path, txt_path):
+                archive.put_text(entry['doc'], txt_path)
+                success_count += 1
+            else:
+                error_count += 1
+                attempts = archive.mark_failed(entry['doc'])
+                if attempts >= EXTRACT_ATTEMPTS:
+                    logging.warning(f"Архив: документ за {key} не удалось извлечь {attempts} раз, больше не пробуем")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return success_count, error_count
+
+def main(downloaded_dir="downloaded_schedules", extracted_dir="extracted_schedules"):
     os.makedirs(extracted_dir, exist_ok=True)
 
     logging.info(f"Сканируем папку {downloaded_dir} на наличие .doc файлов")
@@ -183,20 +217,37 @@ def main():
 
     success_count = 0
     error_count = 0
+    archive = ScheduleArchive()
+    processed = set()
 
     for doc_file in doc_files:
         doc_path = os.path.join(downloaded_dir, doc_file)
         txt_file = day_mapping.get(doc_file, doc_file.replace('.docx', '.txt').replace('.doc', '.txt'))
         txt_path = os.path.join(extracted_dir, txt_file)
         logging.info(f"Обрабатываем {doc_path} -> {txt_path}")
-        if extract_doc_to_txt(doc_path, txt_path):
+        doc_sha = file_sha256(doc_path)
+        processed.add(doc_sha)
+        cached_txt = archive.text_for_document(doc_sha)
+        if cached_txt:
+            # Тот же документ уже извлекался раньше: копируем текст из архива без запуска libreoffice.
+            shutil.copyfile(cached_txt, txt_path)
+            logging.info(f"Текст для {doc_file} взят из архива ({doc_sha[:12]})")
+            success_count += 1
+        elif extract_doc_to_txt(doc_path, txt_path):
+            archive.put_text(doc_sha, txt_path)
             success_count += 1
         else:
             error_count += 1
 
+    # Старые документы архива не влияют на результат: обновление текущего расписания удалось.
+    extracted, failed = extract_archive_documents(archive, skip=processed)
+    if extracted or failed:
+        logging.info(f"Архив: извлечено {extracted}, ошибок {failed}")
+
     logging.info(f"Обработка завершена: {success_count} успешно, {error_count} ошибок")
     if error_count > 0:
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(*sys.argv[1:3])
@@ -1,9 +1,13 @@
 import requests
-from bs4 import BeautifulSoup
 import os
 import re
+import sys
 from datetime import datetime
+from urllib.parse import urljoin
 import time
+from schedule_archive import ScheduleArchive, pick_weekday_dates
+
+SITE_URL = "http://coltechdis.by/obuchayushhimsya/raspisanie-zanyatij/"
 
 
 def is_file_locked(file_path):
@@ -27,24 +31,13 @@ def remove_file_safely(file_path):
                 print(f"  Не удалось удалить {os.path.basename(f)} — возможно, открыт в программе")
 
 
-def download_schedules_from_site(site_url, output_folder="downloaded_schedules"):
-    os.makedirs(output_folder, exist_ok=True)
-
-    try:
-        response = requests.get(site_url)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка при получении страницы: {e}")
-        return
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-
+def find_schedule_links(soup, site_url, verbose=True):
     doc_links = []
     for link in soup.find_all('a'):
         href = link.get('href')
         if href and (href.endswith('.doc') or href.endswith('.docx')):
             if not href.startswith('http'):
-                href = requests.urljoin(site_url, href)
+                href = urljoin(site_url, href)
 
             file_name = os.path.basename(href)
             date_match = re.search(r'(\d{2})\.(\d{2})\.(\d{2,4})', file_name)
@@ -69,8 +62,27 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
 
             doc_links.append((file_name, href, file_date))
 
-            date_str = file_date.strftime('%d.%m.%Y') if file_date else 'Не указана'
-            print(f"Найдена ссылка: {file_name} -> {href} (Дата: {date_str})")
+            if verbose:
+                date_str = file_date.strftime('%d.%m.%Y') if file_date else 'Не указана'
+                print(f"Найдена ссылка: {file_name} -> {href} (Дата: {date_str})")
+    return doc_links
+
+
+def download_schedules_from_site(site_url, output_folder="downloaded_schedules"):
+    os.makedirs(output_folder, exist_ok=True)
+
+    try:
+        response = requests.get(site_url)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Ошибка при получении страницы: {e}")
+        return
+
+    # bs4 нужен только конвейеру обновления; процессу бота модуль нужен лишь ради SITE_URL.
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+    doc_links = find_schedule_links(soup, site_url)
 
     if not doc_links:
         print("Не найдено ссылок на .doc или .docx файлы на странице.")
@@ -86,16 +98,20 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
         return
 
     day_mapping = {
-        0: 'rasp_monday.doc',
-        1: 'rasp_tuesday.doc',
-        2: 'rasp_wednesday.doc',
-        3: 'rasp_thursday.doc',
-        4: 'rasp_friday.doc',
-        5: 'rasp_saturday.doc'
+        0: 'rasp_monday',
+        1: 'rasp_tuesday',
+        2: 'rasp_wednesday',
+        3: 'rasp_thursday',
+        4: 'rasp_friday',
+        5: 'rasp_saturday'
     }
 
     successful = 0
     failed = 0
+    archive = ScheduleArchive()
+    # Несколько дат с одним днём недели (эта и следующая неделя) больше не затирают друг друга:
+    # все документы попадают в архив по дате, а в папку дней недели — только актуальная дата.
+    picked_dates = pick_weekday_dates({d.date() for _, _, d in doc_links if d and d.weekday() <= 5})
 
     print(f"\nНайдено {len(doc_links)} файлов для скачивания:")
     for file_name, file_url, file_date in doc_links:
@@ -115,7 +131,9 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
             failed += 1
             continue
 
-        target_file_name = day_mapping[weekday_num]
+        # Расширение сохраняется: .docx открывается напрямую, без конвертации через libreoffice.
+        extension = os.path.splitext(original_file_name)[1].lower()
+        target_file_name = day_mapping[weekday_num] + extension
         file_path = os.path.join(output_folder, target_file_name)
 
         print(f"\nСкачиваем файл:")
@@ -139,6 +157,11 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
                 failed += 1
                 continue
             else:
+                archive.put_document(file_date, file_response.content, extension, original_file_name)
+                if picked_dates.get(weekday_num) != file_date.date():
+                    print(f"  Сохранён в архив; для дня недели используется дата {picked_dates[weekday_num].strftime('%d.%m.%Y')}")
+                    successful += 1
+                    continue
                 max_retries = 3
                 success = False
                 for attempt in range(max_retries):
@@ -148,8 +171,14 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
                             remove_file_safely(file_path)
                             time.sleep(1)
 
-                        with open(file_path, 'wb') as f:
+                        tmp_path = f"{file_path}.part"
+                        with open(tmp_path, 'wb') as f:
                             f.write(file_response.content)
+                        os.replace(tmp_path, file_path)
+                        for other_extension in ('.doc', '.docx'):
+                            stale_path = os.path.join(output_folder, day_mapping[weekday_num] + other_extension)
+                            if other_extension != extension and os.path.exists(stale_path):
+                                os.remove(stale_path)
 
                         saved_size = os.path.getsize(file_path)
                         if saved_size > 0:
@@ -194,10 +223,11 @@ def download_schedules_from_site(site_url, output_folder="downloaded_schedules")
             except Exception as e:
                 print(f"  Ошибка при обновлении файлов: {e}")
 
+    archive.apply_retention()
     print(f"\nОбработка завершена: {successful} успешно скачано, {failed} ошибок")
 
 
 if __name__ == "__main__":
-    site_url = "http://coltechdis.by/obuchayushhimsya/raspisanie-zanyatij/"
-    output_folder = "downloaded_schedules"
+    output_folder = sys.argv[1] if len(sys.argv) > 1 else "downloaded_schedules"
+    site_url = sys.argv[2] if len(sys.argv) > 2 else SITE_URL
     download_schedules_from_site(site_url, output_folder)
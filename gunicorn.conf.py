@@ -0,0 +1,30 @@
+import os
+import sys
+import subprocess
+import logging
+
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+wsgi_app = "wsgi:application"
+
+refresh_process = None
+
+
+def on_starting(server):
+    # Обновление расписания и установка webhook выполняются одним процессом,
+    # а не в каждом воркере.
+    global refresh_process
+    os.environ.setdefault('SNAPSHOT_BACKEND', 'mmap')
+    os.environ.setdefault('USER_STORE_PATH', os.path.join('state', 'users.sqlite3'))
+    refresh_process = subprocess.Popen([sys.executable, 'main.py', '--refresh-only'])
+    logging.info(f"Запущен процесс обновления расписания (pid {refresh_process.pid})")
+
+
+def on_exit(server):
+    if refresh_process and refresh_process.poll() is None:
+        refresh_process.terminate()
+        try:
+            refresh_process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            refresh_process.kill()
@@ -0,0 +1,197 @@
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import Blueprint, Response, abort, request
+
+from bells import COLLEGE_TZ, bell_schedule, course_group_for
+from schedule_api import accepts_gzip, etag_matches, resolve_source
+from snapshot_store import published_at
+
+ICAL_MAX_AGE = int(os.getenv('ICAL_MAX_AGE', 300))
+ICAL_PAST_DAYS = int(os.getenv('ICAL_PAST_DAYS', 14))
+PRODID = "-//MGKTDLP bot//Schedule//RU"
+
+ical = Blueprint('ical_feed', __name__)
+
+
+
+def escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n'))
+
+
+def fold_line(line):
+    # RFC 5545: строки длиннее 75 октетов переносятся с пробелом в начале продолжения.
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+    return '\r\n '.join(parts)
+
+
+def utc_stamp(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def parse_day_date(value):
+    try:
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_archive_days(archive, snapshot, today):
+    # Архивные даты за последние ICAL_PAST_DAYS дней и все будущие, которых нет в снимке:
+    # индекс и документы архива читаются один раз на версию снимка, а не для каждой группы.
+    snapshot_dates = {parse_day_date(value) for value in snapshot.dates.values()}
+    days = {}
+    try:
+        for day_date in archive.dates():
+            if day_date in snapshot_dates or day_date < today - timedelta(days=ICAL_PAST_DAYS):
+                continue
+            day_schedule, _ = archive.load_schedules(day_date)
+            days[day_date] = day_schedule or {}
+    except Exception as e:
+        logging.error(f"iCal: ошибка при чтении архива: {e}")
+    return days
+
+
+def collect_group_days(snapshot, group_id, archive_days):
+    # Текущие дни снимка плюс заранее прочитанные архивные даты.
+    days = {}
+    for day in snapshot.dates:
+        day_date = parse_day_date(snapshot.dates[day])
+        if day_date:
+            lessons, _ = snapshot.lookup(day, group_id)
+            days[day_date] = lessons or []
+    for day_date, day_schedule in archive_days.items():
+        lessons = day_schedule.get(group_id)
+        days[day_date] = list(lessons) if lessons and any(lessons) else []
+    return days
+
+
+def render_feed(snapshot, group_id, stamp, archive_days):
+    bells = {bell.number: bell for bell in bell_schedule(course_group_for(group_id))}
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(f'Расписание {group_id}')}",
+        "X-WR-TIMEZONE:Europe/Minsk",
+    ]
+    for day_date, lessons in sorted(collect_group_days(snapshot, group_id, archive_days).items()):
+        for number, lesson in enumerate(lessons, start=1):
+            bell = bells.get(number)
+            if not lesson or not bell:
+                continue
+            start = datetime.combine(day_date, bell.start, COLLEGE_TZ)
+            end = datetime.combine(day_date, bell.end, COLLEGE_TZ)
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{day_date.isoformat()}-{number}-{group_id}@mgktdlp-bot",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{utc_stamp(start)}",
+                f"DTEND:{utc_stamp(end)}",
+                f"SUMMARY:{escape_text(f'{number}. {lesson.subject}')}",
+            ]
+            if lesson.rooms:
+                lines.append(f"LOCATION:{escape_text(f'{lesson.rooms} каб.')}")
+            lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return ''.join(fold_line(line) + '\r\n' for line in lines).encode('utf-8')
+
+
+class FeedCache:
+    # Лента группы строится при первом запросе и хранится до следующей версии снимка:
+    # группа -> (тело, gzip-тело, ETag). Публикация снимка ничего не строит заранее.
+    def __init__(self, archive):
+        self.archive = archive
+        self.version = None
+        self.modified = None
+        self.archive_days = None
+        self.feeds = {}
+        self.lock = threading.Lock()
+
+    def prepare(self, snapshot):
+        version = snapshot.version or "legacy"
+        with self.lock:
+            if self.version != version:
+                self.archive_days = load_archive_days(self.archive, snapshot, datetime.now(COLLEGE_TZ).date())
+                self.modified = published_at(snapshot)
+                self.feeds = {}
+                self.version = version
+                logging.info(f"iCal: новый снимок {version}, прочитано {len(self.archive_days)} архивных дат")
+            return version, self.feeds, self.archive_days, self.modified
+
+    def get(self, snapshot, group_id):
+        version, feeds, archive_days, modified = self.prepare(snapshot)
+        entry = feeds.get(group_id)
+        if entry is None:
+            body = render_feed(snapshot, group_id, utc_stamp(modified.astimezone()), archive_days)
+            etag = f"{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+            entry = (body, gzip.compress(body, compresslevel=9, mtime=0), etag)
+            # Если снимок успел смениться, лента попадёт в словарь старой версии и не будет отдана снова.
+            feeds[group_id] = entry
+        return entry, modified
+
+
+# Кэш лент у каждого источника свой: источник -> FeedCache над его архивом.
+_feed_caches = {}
+_feed_caches_lock = threading.Lock()
+
+
+def feed_cache(source):
+    with _feed_caches_lock:
+        if source.key not in _feed_caches:
+            _feed_caches[source.key] = FeedCache(source.archive)
+        return _feed_caches[source.key]
+
+
+def not_modified_since(modified):
+    header = request.headers.get('If-Modified-Since')
+    if not header or request.headers.get('If-None-Match'):
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(modified.astimezone().timestamp()) <= since.timestamp()
+
+
+@ical.route('/ical/<group>.ics')
+@ical.route('/ical/<source>/<group>.ics')
+def group_feed_route(group, source=None):
+    source = resolve_source(source)
+    snapshot = source.get_snapshot()
+    group = group.strip()
+    if group not in snapshot.groups:
+        abort(404)
+    (body, gzip_body, etag), modified = feed_cache(source).get(snapshot, group)
+    use_gzip = accepts_gzip()
+    if use_gzip:
+        etag = f"{etag}-gz"
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': formatdate(modified.astimezone().timestamp(), usegmt=True),
+        'Cache-Control': f"public, max-age={ICAL_MAX_AGE}",
+        'Vary': 'Accept-Encoding',
+    }
+    if etag_matches(etag) or not_modified_since(modified):
+        return Response(status=304, headers=headers)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        body = gzip_body
+    return Response(body, headers=headers, content_type='text/calendar; charset=utf-8')
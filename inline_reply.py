@@ -0,0 +1,118 @@
+import os
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+
+import telebot
+
+import metrics
+
+# Сколько webhook ждёт обработчик, чтобы вернуть его первый ответ прямо в теле HTTP-ответа.
+WEBHOOK_REPLY_DEADLINE = float(os.getenv('WEBHOOK_REPLY_DEADLINE', 1.5))
+
+# Методы, которые можно вернуть в ответе на webhook: имя в Bot API и допустимые параметры.
+INLINE_METHODS = {
+    'answer_callback_query': ('answerCallbackQuery', ('callback_query_id', 'text', 'show_alert', 'url', 'cache_time')),
+    'edit_message_text': ('editMessageText', ('chat_id', 'message_id', 'inline_message_id', 'text', 'parse_mode',
+                                              'reply_markup')),
+}
+
+_local = threading.local()
+
+metrics.describe('bot_webhook_inline_replies_total', "Вызовы API, возвращённые в ответе на webhook вместо отдельного запроса")
+
+
+class InlineReplyCollector:
+    # Telegram принимает в ответе на webhook ровно один вызов метода. Первый подходящий вызов
+    # обработчика забирается сюда вместо отдельного HTTPS-запроса, и webhook сразу отвечает;
+    # после закрытия сборщика (вызов забран или срок вышел) всё уходит обычным путём.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payload = None
+        self.closed = False
+        self.pending = 0
+        # Срабатывает, когда вызов забран или все задачи обработчиков завершились.
+        self.settled = threading.Event()
+        self.settled.set()
+
+    def bind(self, task):
+        with self.lock:
+            self.pending += 1
+            if self.payload is None:
+                self.settled.clear()
+
+        def run(*args, **kwargs):
+            previous = getattr(_local, 'collector', None)
+            _local.collector = self
+            try:
+                return task(*args, **kwargs)
+            finally:
+                _local.collector = previous
+                with self.lock:
+                    self.pending -= 1
+                    if not self.pending:
+                        self.settled.set()
+
+        return run
+
+    def capture(self, payload):
+        with self.lock:
+            if self.closed or self.payload is not None:
+                return False
+            self.payload = payload
+            self.settled.set()
+            return True
+
+    def finish(self, deadline=WEBHOOK_REPLY_DEADLINE):
+        self.settled.wait(deadline)
+        with self.lock:
+            self.closed = True
+            return self.payload
+
+
+@contextmanager
+def collecting(collector):
+    previous = getattr(_local, 'collector', None)
+    _local.collector = collector
+    try:
+        yield collector
+    finally:
+        _local.collector = previous
+
+
+def current():
+    return getattr(_local, 'collector', None)
+
+
+def capture_call(func, args, kwargs):
+    # True, если вызов забран в ответ на webhook; None — выполнять обычным запросом.
+    collector = current()
+    name = getattr(func, '__name__', None)
+    if collector is None or name not in INLINE_METHODS:
+        return None
+    method, allowed = INLINE_METHODS[name]
+    try:
+        arguments = inspect.signature(func).bind(*args, **kwargs).arguments
+    except TypeError:
+        return None
+    if any(key not in allowed and value is not None for key, value in arguments.items()):
+        return None
+    params = {key: value for key, value in arguments.items() if value is not None}
+    if 'reply_markup' in params:
+        params['reply_markup'] = params['reply_markup'].to_dict()
+    if not collector.capture(dict(params, method=method)):
+        return None
+    metrics.increment('bot_webhook_inline_replies_total')
+    logging.debug(f"{method} отправлен в ответе на webhook")
+    return True
+
+
+class InlineReplyBot(telebot.TeleBot):
+    # Обработчики выполняются в пуле потоков telebot; задача, поставленная из webhook,
+    # уносит с собой сборщик ответа этого запроса.
+    def _exec_task(self, task, *args, **kwargs):
+        collector = current()
+        if collector is not None:
+            task = collector.bind(task)
+        super()._exec_task(task, *args, **kwargs)
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+LEADER_LEASE_PATH = os.getenv('LEADER_LEASE_PATH', os.path.join(os.getenv('SNAPSHOTS_DIR', 'snapshots'), '.leader.sqlite3'))
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 60))
+LEASE_NAME = "refresh"
+
+
+def make_holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SqliteLeaseBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)")
+        return conn
+
+    def acquire(self, name, holder, ttl):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT holder, expires_at FROM lease WHERE name = ?", (name,)).fetchone()
+            now = time.time()
+            if row and row[0] != holder and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO lease (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at",
+                (name, holder, now + ttl))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def release(self, name, holder):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM lease WHERE name = ? AND holder = ?", (name, holder))
+        finally:
+            conn.close()
+
+    def holder(self, name):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT holder, expires_at FROM lease WHERE name = ?", (name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row and row[1] > time.time() else None
+
+
+class FileLeaseBackend:
+    # Для общих томов без надёжных блокировок SQLite: аренда записывается через os.replace,
+    # после чего претендент перечитывает файл и убеждается, что победил именно он.
+    VERIFY_DELAY = 0.2
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, holder, expires_at):
+        tmp_path = f"{self.path}.{holder.replace(':', '_')}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'holder': holder, 'expires_at': expires_at}, f)
+        os.replace(tmp_path, self.path)
+
+    def acquire(self, name, holder, ttl):
+        lease = self._read()
+        now = time.time()
+        if lease and lease.get('holder') != holder and lease.get('expires_at', 0) > now:
+            return False
+        taking_over = not lease or lease.get('holder') != holder
+        self._write(holder, now + ttl)
+        if taking_over:
+            time.sleep(self.VERIFY_DELAY)
+            lease = self._read()
+            return bool(lease) and lease.get('holder') == holder
+        return True
+
+    def release(self, name, holder):
+        lease = self._read()
+        if lease and lease.get('holder') == holder:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def holder(self, name):
+        lease = self._read()
+        return lease['holder'] if lease and lease.get('expires_at', 0) > time.time() else None
+
+
+class LeaderLease:
+    def __init__(self, path=LEADER_LEASE_PATH, name=LEASE_NAME, ttl=LEADER_LEASE_TTL, holder_id=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith(('.sqlite3', '.sqlite', '.db')):
+            self.backend = SqliteLeaseBackend(path)
+        else:
+            self.backend = FileLeaseBackend(path)
+        self.name = name
+        self.ttl = ttl
+        self.holder_id = holder_id or make_holder_id()
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+
+    @property
+    def is_leader(self):
+        # Оставляем запас в треть TTL, чтобы не считать себя лидером, когда аренду уже могли перехватить.
+        return time.monotonic() < self._valid_until - self.ttl / 3
+
+    def try_acquire(self):
+        was_leader = self.is_leader
+        started = time.monotonic()
+        try:
+            acquired = self.backend.acquire(self.name, self.holder_id, self.ttl)
+        except Exception as e:
+            logging.error(f"Ошибка при продлении аренды лидера: {e}")
+            acquired = False
+        if acquired:
+            self._valid_until = started + self.ttl
+            if not was_leader:
+                logging.info(f"Процесс {self.holder_id} стал лидером обновления расписания")
+        else:
+            self._valid_until = 0.0
+            if was_leader:
+                logging.warning(f"Процесс {self.holder_id} потерял лидерство")
+        return acquired
+
+    def release(self):
+        self._stop.set()
+        self._valid_until = 0.0
+        try:
+            self.backend.release(self.name, self.holder_id)
+            logging.info(f"Аренда лидера освобождена процессом {self.holder_id}")
+        except Exception as e:
+            logging.error(f"Ошибка при освобождении аренды лидера: {e}")
+
+    def current_holder(self):
+        return self.backend.holder(self.name)
+
+    def run_renewal(self):
+        while not self._stop.is_set():
+            self.try_acquire()
+            self._stop.wait(self.ttl / 3)
+
+    def start_renewal(self):
+        thread = threading.Thread(target=self.run_renewal, daemon=True)
+        thread.start()
+        return thread
+
+
+def _demo_worker(path, ttl, duration):
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - {os.getpid()} - %(message)s')
+    lease = LeaderLease(path, ttl=ttl)
+    lease.start_renewal()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        time.sleep(ttl / 3)
+    lease.release()
+
+
+def run_demo(processes=3, ttl=3.0, duration=20.0, path=None):
+    # Локальная проверка: несколько процессов делят одну аренду, лидер убивается без
+    # освобождения аренды, и после истечения TTL лидерство переходит к другому.
+    import multiprocessing
+    import tempfile
+
+    path = path or os.path.join(tempfile.mkdtemp(), 'leader.sqlite3')
+    workers = [multiprocessing.Process(target=_demo_worker, args=(path, ttl, duration)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    observer = LeaderLease(path, ttl=ttl)
+    time.sleep(ttl)
+    leader = observer.current_holder()
+    print(f"Лидер: {leader}")
+    victim = next((w for w in workers if leader and f":{w.pid}:" in leader), None)
+    if victim:
+        victim.kill()
+        print(f"Процесс-лидер {victim.pid} убит, ждём перехвата аренды...")
+    time.sleep(ttl * 2)
+    new_leader = observer.current_holder()
+    print(f"Новый лидер: {new_leader}")
+    for worker in workers:
+        worker.join()
+    return leader, new_leader
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) > 1 and sys.argv[1] == "demo":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+        demo_path = sys.argv[3] if len(sys.argv) > 3 else None
+        first, second = run_demo(processes=count, path=demo_path)
+        sys.exit(0 if first and second and first != second else 1)
+    lease = LeaderLease()
+    print(f"Текущий лидер: {lease.current_holder() or 'нет'}")
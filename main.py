@@ -1,40 +1,87 @@
 import subprocess
 import sys
 import os
-import schedule
-import time
 import telebot
 from flask import Flask, request, jsonify
 import threading
 from dotenv import load_dotenv
 import signal
 import logging
-import parse_schedule
-import requests
 
+# До импорта модулей проекта: они читают настройки окружения при импорте, а первый
+# же вызов logging до basicConfig настроил бы корневой логгер на уровень WARNING.
+load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-load_dotenv()
+import parse_schedule
+import snapshot_store
+import shared_snapshot
+import schedule_api
+import ical_feed
+import leader_lease
+import refresh_scheduler
+import sources
+import inline_reply
+import shadow_parser
+import metrics
+import requests
+
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
     logging.error("BOT_TOKEN не указан в переменных окружения")
     sys.exit(1)
 
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'auto')
+UPDATES_OFFSET_PATH = os.getenv('UPDATES_OFFSET_PATH', os.path.join('state', 'update_offset'))
+POLLING_BATCH_LIMIT = 100
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', 50))
+POLLING_ERROR_DELAY = 5
+# telebot — потоки pyTelegramBotAPI; async — один цикл событий python-telegram-bot.
+BOT_ENGINE = os.getenv('BOT_ENGINE', 'telebot')
+
 running = True
+stop_event = threading.Event()
 flask_app = Flask(__name__)
+leader = leader_lease.LeaderLease()
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# Через bot идут и служебные вызовы (webhook, рассылка), поэтому он есть при любом движке.
+bot = inline_reply.InlineReplyBot(BOT_TOKEN)
+engine = None
 
-parse_schedule.register_handlers(bot)
+parse_schedule.setup()
+if BOT_ENGINE == 'async':
+    import async_engine
+    engine = async_engine.AsyncEngine(BOT_TOKEN)
+    parse_schedule.register_handlers(engine.facade)
+else:
+    parse_schedule.register_handlers(bot)
 logging.info("Обработчики из parse_schedule зарегистрированы")
+flask_app.register_blueprint(schedule_api.api)
+flask_app.register_blueprint(ical_feed.ical)
+flask_app.register_blueprint(metrics.metrics_api)
+
+def dispatch_updates(updates):
+    # Общая точка входа для webhook и long polling: словари обновлений в формате Bot API.
+    if engine:
+        engine.feed(updates)
+    else:
+        bot.process_new_updates([telebot.types.Update.de_json(update) for update in updates])
 
 @flask_app.route(f'/{BOT_TOKEN}', methods=['POST'])
 def webhook():
     try:
         if request.content_type == 'application/json':
             update = request.get_json()
-            bot.process_new_updates([telebot.types.Update.de_json(update)])
-            return jsonify({'status': 'ok'})
+            if engine or 'callback_query' not in update:
+                dispatch_updates([update])
+                return jsonify({'status': 'ok'})
+            # Первый ответ обработчика (answerCallbackQuery или правка сообщения) уходит
+            # в теле этого ответа, если обработчик успел до срока; остальное — обычными запросами.
+            collector = inline_reply.InlineReplyCollector()
+            with inline_reply.collecting(collector):
+                dispatch_updates([update])
+            payload = collector.finish()
+            return jsonify(payload or {'status': 'ok'})
         logging.error(f"Неверный content_type: {request.content_type}")
         return 'Bad Request', 400
     except Exception as e:
@@ -45,21 +92,24 @@ def webhook():
 def index():
     return 'Telegram Bot is running! 🚀'
 
-def run_script(script_name):
-    logging.info(f"Начинаем запуск {script_name}...")
+def run_script(script_name, *args, env=None):
+    logging.info(f"Начинаем запуск {script_name} {' '.join(args)}...")
     if not os.path.exists(script_name):
         logging.error(f"Скрипт {script_name} не найден в текущей директории: {os.getcwd()}")
         return False
     try:
-        result = subprocess.run(
-            [sys.executable, script_name],
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            timeout=300
-        )
+        # Скачивания и конвертации всех источников делят общий бюджет REFRESH_WORKERS.
+        with sources.worker_budget:
+            result = subprocess.run(
+                [sys.executable, script_name, *args],
+                check=True,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                timeout=300,
+                env={**os.environ, **env} if env else None
+            )
         logging.info(f"Скрипт {script_name} успешно выполнен")
         if result.stdout.strip():
             logging.info("STDOUT:")
@@ -79,38 +129,80 @@ def run_script(script_name):
         logging.error(f"Таймаут выполнения {script_name}: {e}")
         return False
 
-def run_all_scripts_at_startup():
-    scripts = ['get_schedule.py', 'extract_schedule.py']
+def run_refresh_pipeline(source, require_download=True):
+    store = source.store
+    build = store.new_build()
+    scripts = [('get_schedule.py', build.downloaded_dir, source.site_url),
+               ('extract_schedule.py', build.downloaded_dir, build.extracted_dir)]
     success_count = 0
-    for script in scripts:
-        if run_script(script):
+    logging.info(f"Обновление источника {source.key}: сборка {build.version}")
+    for script, *args in scripts:
+        if run_script(script, *args, env=source.script_env()):
             success_count += 1
+        elif require_download and script == 'get_schedule.py':
+            logging.error("get_schedule.py завершился с ошибкой, extract_schedule.py не запускается.")
+            store.discard(build)
+            return False
         else:
             logging.error(f"Скрипт {script} завершился с ошибкой, продолжаем...")
-    extracted_dir = "extracted_schedules"
-    if os.path.exists(extracted_dir):
-        files = os.listdir(extracted_dir)
-        logging.info(f"Содержимое папки {extracted_dir}: {files}")
-    else:
-        logging.error(f"Папка {extracted_dir} не существует")
-    logging.info(f"Все скрипты при старте выполнены: {success_count}/{len(scripts)} успешно")
+    logging.info(f"Скрипты конвейера выполнены: {success_count}/{len(scripts)} успешно")
+    if not build.has_extracted_files():
+        logging.error(f"Сборка {build.version} не содержит извлечённых файлов, публикация отменена")
+        store.discard(build)
+        return False
+    logging.info(f"Содержимое папки {build.extracted_dir}: {os.listdir(build.extracted_dir)}")
+    try:
+        shared_snapshot.write_for_build(build)
+    except Exception as e:
+        logging.error(f"Ошибка при записи разделяемого файла расписания: {e}")
+    if not leader.is_leader:
+        logging.warning(f"Лидерство потеряно во время сборки {build.version}, публикация отменена")
+        store.discard(build)
+        return False
+    store.publish(build)
+    shadow_parser.compare_published(store.refresh_snapshot(force=True))
+    return True
 
-def run_scheduled_task():
-    if not running:
+def refresh_source_at_startup(source):
+    if run_refresh_pipeline(source, require_download=False):
+        schedulers[source.key].prime()
+
+def run_all_scripts_at_startup():
+    leader.try_acquire()
+    leader.start_renewal()
+    if not leader.is_leader:
+        logging.info(f"Расписание обновляет другой экземпляр ({leader.current_holder()}), ждём опубликованных снимков")
         return
-    logging.info("Запуск задачи по расписанию...")
-    success = run_script('get_schedule.py')
-    if success:
-        logging.info("get_schedule.py завершён успешно, запускаем extract_schedule.py...")
-        run_script('extract_schedule.py')
-        extracted_dir = "extracted_schedules"
-        if os.path.exists(extracted_dir):
-            files = os.listdir(extracted_dir)
-            logging.info(f"Содержимое папки {extracted_dir}: {files}")
-        else:
-            logging.error(f"Папка {extracted_dir} не существует")
-    else:
-        logging.error("get_schedule.py завершился с ошибкой, extract_schedule.py не запускается.")
+    # Источники обновляются параллельно, тяжёлые шаги ограничены общим worker_budget.
+    threads = [threading.Thread(target=refresh_source_at_startup, args=(source,), daemon=True)
+               for source in sources.all_sources().values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def run_scheduled_task(source):
+    if not running:
+        return False
+    if not leader.is_leader:
+        logging.info("Этот экземпляр не лидер, обновление пропущено")
+        return False
+    logging.info(f"Запуск обновления расписания источника {source.key}...")
+    return run_refresh_pipeline(source)
+
+def create_scheduler(source):
+    return refresh_scheduler.AdaptiveScheduler(
+        refresh_scheduler.ChangeDetector(source.site_url),
+        on_change=lambda: run_scheduled_task(source),
+        should_poll=lambda: running and leader.is_leader,
+        periods=source.poll_periods,
+    )
+
+schedulers = {key: create_scheduler(source) for key, source in sources.all_sources().items()}
+
+def stop_schedulers():
+    for source_scheduler in schedulers.values():
+        source_scheduler.stop()
 
 def check_webhook():
     try:
@@ -127,6 +219,74 @@ def check_webhook():
     except Exception as e:
         logging.error(f"Ошибка при запросе getWebhookInfo: {e}")
 
+def select_update_mode():
+    if UPDATE_MODE in ('webhook', 'polling'):
+        return UPDATE_MODE
+    return 'webhook' if os.getenv('RENDER_EXTERNAL_HOSTNAME') else 'polling'
+
+def load_update_offset():
+    try:
+        with open(UPDATES_OFFSET_PATH, 'r', encoding='utf-8') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def save_update_offset(offset):
+    directory = os.path.dirname(UPDATES_OFFSET_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{UPDATES_OFFSET_PATH}.part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(str(offset))
+    os.replace(tmp_path, UPDATES_OFFSET_PATH)
+
+def run_polling():
+    # getUpdates допускает только одного получателя на токен, поэтому опрашивает только лидер.
+    offset = load_update_offset()
+    webhook_removed = False
+    logging.info(f"Режим long polling: пакеты до {POLLING_BATCH_LIMIT} обновлений, таймаут {POLLING_TIMEOUT} с, offset {offset}")
+    while running:
+        if not leader.is_leader:
+            webhook_removed = False
+            stop_event.wait(leader.ttl / 3)
+            continue
+        try:
+            if not webhook_removed:
+                bot.remove_webhook()
+                webhook_removed = True
+            updates = telebot.apihelper.get_updates(
+                BOT_TOKEN,
+                offset=offset,
+                limit=POLLING_BATCH_LIMIT,
+                timeout=POLLING_TIMEOUT + 10,
+                long_polling_timeout=POLLING_TIMEOUT
+            )
+        except Exception as e:
+            logging.error(f"Ошибка getUpdates: {e}")
+            stop_event.wait(POLLING_ERROR_DELAY)
+            continue
+        if not updates:
+            continue
+        try:
+            dispatch_updates(updates)
+        except Exception as e:
+            # offset не сдвигается: тот же пакет будет запрошен снова.
+            logging.error(f"Ошибка обработки пакета обновлений: {e}")
+            stop_event.wait(POLLING_ERROR_DELAY)
+            continue
+        offset = updates[-1]['update_id'] + 1
+        try:
+            save_update_offset(offset)
+        except OSError as e:
+            logging.error(f"Не удалось сохранить offset {offset}: {e}")
+        logging.debug(f"Обработано обновлений: {len(updates)}, следующий offset: {offset}")
+
+def setup_updates():
+    if select_update_mode() == 'webhook':
+        setup_webhook()
+    else:
+        run_polling()
+
 def setup_webhook():
     render_hostname = os.getenv('RENDER_EXTERNAL_HOSTNAME')
     if render_hostname:
@@ -144,11 +304,51 @@ def signal_handler(sig, frame):
     global running
     logging.info("Получен сигнал остановки. Завершаем работу...")
     running = False
+    stop_event.set()
+    stop_schedulers()
+    if engine:
+        engine.stop()
+    leader.release()
     bot.remove_webhook()
     logging.info("Webhook удалён")
     sys.exit(0)
 
+def refresh_signal_handler(sig, frame):
+    global running
+    logging.info("Получен сигнал остановки процесса обновления")
+    running = False
+    stop_event.set()
+    stop_schedulers()
+    leader.release()
+    sys.exit(0)
+
+def send_digest(user_id, text):
+    # Без retry_api_call: ошибки 429/403 разбирает сам отправитель рассылки.
+    bot.send_message(user_id, text, parse_mode='MarkdownV2')
+
+def start_digests():
+    # Рассылает только лидер, иначе каждый экземпляр отправил бы дайджест повторно.
+    threading.Thread(
+        target=parse_schedule.digest_scheduler.run,
+        args=(send_digest,),
+        kwargs={'should_run': lambda: running and leader.is_leader, 'stop_event': stop_event},
+        daemon=True
+    ).start()
+
+def run_refresh_only():
+    # Отдельный процесс обновления для режима WSGI: воркеры только читают опубликованные снимки.
+    logging.info("main.py запущен в режиме обновления расписания")
+    signal.signal(signal.SIGINT, refresh_signal_handler)
+    signal.signal(signal.SIGTERM, refresh_signal_handler)
+    run_all_scripts_at_startup()
+    threading.Thread(target=setup_updates, daemon=True).start()
+    start_digests()
+    run_schedule_in_background()
+
 def main():
+    if '--refresh-only' in sys.argv[1:]:
+        run_refresh_only()
+        return
     logging.info("main.py запущен. Начинаем инициализацию...")
     logging.info(f"Текущая директория: {os.getcwd()}")
     logging.info(f"Файлы в директории: {os.listdir()}")
@@ -158,9 +358,12 @@ def main():
 
     run_all_scripts_at_startup()
     threading.Thread(target=run_schedule_in_background, daemon=True).start()
-    threading.Thread(target=setup_webhook, daemon=True).start()
+    threading.Thread(target=snapshot_store.watch_snapshots,
+                     kwargs={'stores': [source.store for source in sources.all_sources().values()]}, daemon=True).start()
+    threading.Thread(target=setup_updates, daemon=True).start()
+    start_digests()
 
-    logging.info("Бот инициализирован и готов к работе")
+    logging.info(f"Бот инициализирован и готов к работе (режим обновлений: {select_update_mode()})")
     port = int(os.getenv('PORT', 10000))
     logging.info(f"Запускаем Flask на порту {port} (для Render)")
     try:
@@ -169,13 +372,11 @@ def main():
         logging.error(f"Ошибка Flask: {e}")
 
 def run_schedule_in_background():
-    schedule.every().day.at("06:00").do(run_scheduled_task)
-    schedule.every().day.at("12:00").do(run_scheduled_task)
-    schedule.every().day.at("18:00").do(run_scheduled_task)
-    schedule.every().day.at("24:00").do(run_scheduled_task)
-    while running:
-        schedule.run_pending()
-        time.sleep(60)
+    threads = [threading.Thread(target=source_scheduler.run, daemon=True) for source_scheduler in schedulers.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,45 @@
+import os
+import threading
+
+from flask import Blueprint, Response
+
+# Счётчики процесса в текстовом формате Prometheus. Под gunicorn у каждого воркера свои
+# значения, а /metrics отвечает тот воркер, которому достался запрос: это выборка одного
+# процесса, а не сумма по всем. Метка pid позволяет не путать воркеры при сборе.
+_counters = {}
+_descriptions = {}
+_lock = threading.Lock()
+
+metrics_api = Blueprint('metrics', __name__)
+
+
+def describe(name, description):
+    _descriptions[name] = description
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def render():
+    with _lock:
+        counters = dict(_counters)
+    pid = os.getpid()
+    lines = []
+    for name in sorted(set(counters) | set(_descriptions)):
+        if name in _descriptions:
+            lines.append(f"# HELP {name} {_descriptions[name]}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f'{name}{{pid="{pid}"}} {counters.get(name, 0)}')
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_api.route('/metrics')
+def metrics_endpoint():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
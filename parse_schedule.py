@@ -1,24 +1,76 @@
 import re
 import os
+import inspect
 import telebot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
 import logging
 import time
-from dotenv import load_dotenv
+import threading
+from functools import partial
+from user_store import open_user_digests, open_user_groups, open_user_sources
+from sources import all_sources, default_source, get_source, is_multi_source
+from datetime import datetime, timedelta
+from schedule_model import format_lesson
+from bells import bells_at, course_group_for, format_bells_html, format_time, local_now
+from search_index import GROUP, SUBJECT, ROOM, ResultCache, normalize
+from digest import DigestScheduler, RenderCache, format_minute, parse_digest_time
+import inline_reply
+import shadow_parser
+from edit_coalescer import EditCoalescer
+from analytics import usage
+from timetable_media import MediaCache
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Хранилища пользователей, кэши по источникам, очередь правок и рассылка создаются в setup(),
+# а не при импорте: парсер из этого модуля нужен и процессам конвейера.
+user_groups = None
+user_sources = None
+search_caches = {}
+media_caches = {}
+edit_queue = None
+digest_scheduler = None
+_setup_lock = threading.Lock()
 
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
-    logging.error("BOT_TOKEN не найден в переменных окружения")
-    raise ValueError("BOT_TOKEN не найден")
+DAYS_ORDER = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+WEEKDAY_SHORT = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# Поиск по группам, предметам и кабинетам: ответы кэшируются на версию снимка,
+# а Telegram дополнительно держит inline-результаты у себя INLINE_CACHE_TIME секунд.
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 300))
+SEARCH_RESULTS_LIMIT = 20
+PLACES_LIMIT = 40
+# После публикации снимка заранее отрисовываются самые просматриваемые пары (группа, день).
+WARM_RENDERS = int(os.getenv('WARM_RENDERS', 50))
 
-user_groups = {}
+def telebot_arguments(func, args, kwargs):
+    # Асинхронный движок сам заменяет устаревшие правки и упорядочивает вызовы в цикле событий.
+    if not isinstance(getattr(func, '__self__', None), telebot.TeleBot):
+        return None
+    return inspect.signature(func).bind(*args, **kwargs).arguments
 
-def retry_api_call(func, *args, retries=3, delay=1, **kwargs):
+def retry_api_call(func, *args, retries=3, delay=1, on_error=None, **kwargs):
+    # on_error(e) вызывается, если запрос так и не удался; для правки из очереди —
+    # когда до неё дошла очередь, поэтому ошибку нельзя ловить вокруг вызова.
+    if inline_reply.capture_call(func, args, kwargs):
+        return True
+    if on_error is not None and 'on_error' in inspect.signature(func).parameters:
+        return call_with_retries(func, args, dict(kwargs, on_error=on_error), retries, delay)
+    arguments = telebot_arguments(func, args, kwargs)
+    chat_id = arguments.get('chat_id') if arguments else None
+    if chat_id is not None:
+        if func.__name__ == 'edit_message_text' and arguments.get('message_id') is not None:
+            edit_queue.submit((chat_id, arguments['message_id']),
+                              lambda: call_with_retries(func, args, kwargs, retries, delay), on_error)
+            return True
+        edit_queue.wait_chat(chat_id)
+    try:
+        return call_with_retries(func, args, kwargs, retries, delay)
+    except Exception as e:
+        if on_error is None:
+            raise
+        on_error(e)
+        return None
+
+def call_with_retries(func, args, kwargs, retries, delay):
     for attempt in range(retries):
         try:
             return func(*args, **kwargs)
@@ -34,49 +86,46 @@ def escape_markdown_v2(text):
     special_chars = r'([_~`\[()\]#+-=|{.}!])'
     return re.sub(special_chars, r'\\\1', str(text))
 
-def save_schedule(groups, block_schedule, schedules):
+def clean_lesson(lesson):
+    cleaned = re.sub(r'^\d+\s*', '', lesson).strip()
+    cleaned = re.sub(r'\s+', ' ', cleaned.replace('\xa0', ' '))
+    if cleaned.startswith('-------') or cleaned == '-------':
+        return '', ''
+    concatenated_pattern = r'^([^0-9|]+?)([0-9/]+)$'
+    concatenated_match = re.match(concatenated_pattern, cleaned)
+    if concatenated_match:
+        subject = concatenated_match.group(1).strip()
+        rooms = concatenated_match.group(2).strip()
+        rooms = rooms.lstrip('/')
+        subject = subject.replace('|', '/')
+        return subject, rooms
+    subject_pattern = r'^[^0-9|]*'
+    subject_match = re.search(subject_pattern, cleaned)
+    if subject_match and subject_match.group(0).strip():
+        subject = subject_match.group(0).rstrip('|').strip()
+        rooms = cleaned[subject_match.end():].strip()
+        rooms = re.sub(r'\bпр', '', rooms)
+        rooms = rooms.lstrip('/')
+        subject = subject.replace('|', '/')
+        return subject, rooms
+    return cleaned.replace('|', '/'), ''
+
+def save_schedule(groups, block_schedule, schedules, structured=False):
     logging.debug(f"Сохранение расписания для групп: {groups}")
     try:
         for col, group in enumerate(groups):
             group = group.strip()
             lessons = []
             for lesson in block_schedule[col]:
-                if lesson:
-                    cleaned = re.sub(r'^\d+\s*', '', lesson).strip()
-                    cleaned = re.sub(r'\s+', ' ', cleaned.replace('\xa0', ' '))
-                    if cleaned.startswith('-------') or cleaned == '-------':
-                        lessons.append('')
-                        continue
-                    concatenated_pattern = r'^([^0-9|]+?)([0-9/]+)$'
-                    concatenated_match = re.match(concatenated_pattern, cleaned)
-                    if concatenated_match:
-                        subject = concatenated_match.group(1).strip()
-                        rooms = concatenated_match.group(2).strip()
-                        rooms = rooms.lstrip('/')
-                        subject = subject.replace('|', '/')
-                        cleaned = f"{subject} – {rooms} каб." if rooms else subject
-                    else:
-                        subject_pattern = r'^[^0-9|]*'
-                        subject_match = re.search(subject_pattern, cleaned)
-                        if subject_match and subject_match.group(0).strip():
-                            subject = subject_match.group(0).rstrip('|').strip()
-                            rooms = cleaned[subject_match.end():].strip()
-                            rooms = re.sub(r'\bпр', '', rooms)
-                            rooms = rooms.lstrip('/')
-                            subject = subject.replace('|', '/')
-                            cleaned = f"{subject} – {rooms} каб." if rooms else subject
-                        else:
-                            cleaned = cleaned.replace('|', '/')
-                    lessons.append(cleaned)
-                else:
-                    lessons.append('')
+                subject, rooms = clean_lesson(lesson) if lesson else ('', '')
+                lessons.append((subject, rooms) if structured else format_lesson(subject, rooms))
             schedules[group] = lessons
             logging.debug(f"Сохранено расписание для группы {group}: {lessons}")
     except Exception as e:
         logging.error(f"Ошибка при сохранении расписания: {e}")
 
-def parse_schedule(file_path, group_id):
-    logging.debug(f"Парсинг файла: {file_path} для группы: {group_id}")
+def parse_schedule_file(file_path, structured=False):
+    logging.debug(f"Парсинг файла: {file_path}")
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
             content = file.read()
@@ -154,7 +203,7 @@ def parse_schedule(file_path, group_id):
                 cells = [cell.strip() for cell in line.split('│')[1:-1]]
                 if line.startswith('┌') or line.startswith('└'):
                     if groups and block_schedule:
-                        save_schedule(groups, block_schedule, schedules)
+                        save_schedule(groups, block_schedule, schedules, structured)
                     break
                 if line.startswith('│') and line.count('│') >= 3 and all(
                         cell and (
@@ -163,7 +212,7 @@ def parse_schedule(file_path, group_id):
                         ) for cell in cells
                 ):
                     if groups and block_schedule:
-                        save_schedule(groups, block_schedule, schedules)
+                        save_schedule(groups, block_schedule, schedules, structured)
                     i -= 1
                     break
                 if len(cells) != num_columns:
@@ -173,11 +222,18 @@ def parse_schedule(file_path, group_id):
                 i += 1
 
             if groups and block_schedule and i >= len(lines):
-                save_schedule(groups, block_schedule, schedules)
+                save_schedule(groups, block_schedule, schedules, structured)
 
         i += 1
 
     logging.debug(f"Итоговый словарь schedules: {schedules}")
+    return schedules, date
+
+def parse_schedule(file_path, group_id):
+    logging.debug(f"Парсинг файла: {file_path} для группы: {group_id}")
+    schedules, date = parse_schedule_file(file_path)
+    if schedules is None:
+        return None, None
     group_id = group_id.strip()
     logging.debug(f"Проверяем группу: {group_id}")
     if group_id in schedules and any(schedules[group_id]):
@@ -188,7 +244,6 @@ def parse_schedule(file_path, group_id):
         return None, date
 
 def get_schedule_files(folder_path="extracted_schedules"):
-    days_order = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
     days_map = {
         'rasp_monday.txt': 'Понедельник',
         'rasp_tuesday.txt': 'Вторник',
@@ -209,50 +264,32 @@ def get_schedule_files(folder_path="extracted_schedules"):
             logging.debug(f"Найден файл расписания: {filename} -> {day_name}")
     return schedule_files
 
-def get_available_groups(folder_path="extracted_schedules"):
-    groups = set()
-    schedule_files = get_schedule_files(folder_path)
-    if not schedule_files:
-        logging.error(f"Нет файлов расписания в {folder_path}")
-        return groups
-    for day, file_path in schedule_files.items():
-        logging.debug(f"Проверяем группы в файле: {file_path}")
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            lines = content.rstrip('\n').splitlines()
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line.startswith('┌') or (line.startswith('│') and line.count('│') >= 3):
-                    line = line.replace('\xa0', ' ').replace('\u200b', '').replace('\ufeff', '')
-                    cells = [cell.strip() for cell in line.split('│')[1:-1]]
-                    is_group_line = cells and all(
-                        cell and (
-                            re.match(r'^\d{3,}$', cell) or
-                            re.match(r'^\d+ТО$', cell)
-                        ) for cell in cells
-                    )
-                    if is_group_line:
-                        groups.update(cell.strip() for cell in cells if cell.strip())
-                        logging.debug(f"Найдены группы в строке {i}: {cells}")
-        except FileNotFoundError:
-            logging.error(f"Файл {file_path} не найден")
-            continue
-        except UnicodeDecodeError:
-            logging.error(f"Ошибка декодирования файла {file_path}")
-            continue
+def sort_groups(groups):
     numeric_groups = [g for g in groups if g.isdigit()]
     special_groups = ["8ТО", "9ТО", "10ТО"]
     numeric_groups.sort(key=lambda x: int(x), reverse=True)
-    sorted_groups = numeric_groups + [g for g in special_groups if g in groups]
-    logging.debug(f"Итоговый список групп: {sorted_groups}")
-    return sorted_groups
+    return numeric_groups + [g for g in special_groups if g in groups]
+
+def source_for_user(user_id):
+    return get_source(user_sources.get(user_id))
+
+def snapshot_for_user(user_id):
+    return source_for_user(user_id).get_snapshot()
 
 def get_main_keyboard():
     keyboard = InlineKeyboardMarkup(row_width=1)
+    keyboard.add(InlineKeyboardButton("⏱ Сейчас", callback_data="now"))
     keyboard.add(InlineKeyboardButton("🔔 Расписание звонков", callback_data="bells"))
     keyboard.add(InlineKeyboardButton("📚 Расписание уроков", callback_data="lessons"))
     keyboard.add(InlineKeyboardButton("👥 Выбрать группу", callback_data="select_group"))
+    if is_multi_source():
+        keyboard.add(InlineKeyboardButton("🏫 Сменить учебное заведение", callback_data="select_source"))
+    return keyboard
+
+def get_sources_keyboard():
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    keyboard.add(*[InlineKeyboardButton(f"🏫 {source.title}", callback_data=f"source_{source.key}")
+                   for source in all_sources().values()])
     return keyboard
 
 def get_groups_keyboard(groups, context="select", page=1):
@@ -281,14 +318,268 @@ def get_days_keyboard():
     days = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
     buttons = [InlineKeyboardButton(f"📅 {day}", callback_data=day) for day in days]
     keyboard.add(*buttons)
+    keyboard.add(InlineKeyboardButton("⏱ Сейчас", callback_data="now"))
+    keyboard.row(InlineKeyboardButton("🖼 Неделя картинкой", callback_data="week_image"),
+                 InlineKeyboardButton("📄 Документ колледжа", callback_data="document"))
+    keyboard.add(InlineKeyboardButton("📆 Другие даты", callback_data="dates"))
     keyboard.add(InlineKeyboardButton("🔄 Сменить группу", callback_data="change_group"))
     keyboard.add(InlineKeyboardButton("🔙 Вернуться", callback_data="back_main"))
     return keyboard
 
+def get_dates_keyboard(today=None, limit=12, archive=None):
+    today = today or datetime.now().date()
+    archive = archive or default_source().archive
+    dates = [d for d in archive.dates() if d >= today - timedelta(days=7)][:limit]
+    keyboard = InlineKeyboardMarkup(row_width=3)
+    buttons = [InlineKeyboardButton(f"📆 {d.strftime('%d.%m')} {WEEKDAY_SHORT[d.weekday()]}", callback_data=f"date_{d.isoformat()}")
+               for d in dates]
+    keyboard.add(*buttons)
+    keyboard.add(InlineKeyboardButton("🔙 Вернуться", callback_data="lessons"))
+    return keyboard, dates
+
+def format_day_schedule(group_id, day, date, schedule):
+    response = f"📚 Расписание для группы *{group_id}* на *{day}* ({date}):\n\n"
+    for idx, lesson in enumerate(schedule, start=1):
+        if lesson.rooms:
+            response += f"*{idx}.* {lesson.subject} – *{lesson.rooms} каб.*\n"
+        elif lesson:
+            response += f"*{idx}.* {lesson.subject}\n"
+        else:
+            response += f"*{idx}.* Нет урока\n"
+    return escape_markdown_v2(response)
+
+def parse_date_argument(text, today=None):
+    today = today or datetime.now().date()
+    match = re.search(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?', text or '')
+    if not match:
+        return None
+    day, month, year = match.groups()
+    year = int(year) if year else today.year
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, int(month), int(day)).date()
+    except ValueError:
+        return None
+
+def render_date_schedule(schedule_date, group_id, archive=None):
+    schedules, date = (archive or default_source().archive).load_schedules(schedule_date)
+    day = DAYS_ORDER[schedule_date.weekday()] if schedule_date.weekday() < len(DAYS_ORDER) else schedule_date.strftime('%d.%m.%Y')
+    if schedules is None:
+        return escape_markdown_v2(f"❌ Расписание на *{schedule_date.strftime('%d.%m.%Y')}* не найдено в архиве.")
+    schedule = schedules.get(group_id.strip())
+    if not schedule or not any(schedule):
+        return escape_markdown_v2(f"❌ Группа *{group_id}* не найдена в расписании на *{schedule_date.strftime('%d.%m.%Y')}*.")
+    return format_day_schedule(group_id, day, date, schedule)
+
+def nearest_day(snapshot, now=None):
+    # Сегодняшний день, а если его нет в снимке (или сегодня воскресенье) — ближайший следующий.
+    weekday = (now or local_now()).weekday()
+    for offset in range(7):
+        index = (weekday + offset) % 7
+        if index < len(DAYS_ORDER) and snapshot.has_day(DAYS_ORDER[index]):
+            return DAYS_ORDER[index]
+    return None
+
+def render_digest(user_id, now=None):
+    # Следующий учебный день; если снимок ещё показывает прошлую неделю — точная дата из архива.
+    group_id = user_groups.get(user_id)
+    if not group_id:
+        return None
+    source = source_for_user(user_id)
+    snapshot = source.get_snapshot()
+    target = (now or local_now()).date() + timedelta(days=1)
+    if target.weekday() == 6:
+        target += timedelta(days=1)
+    day = DAYS_ORDER[target.weekday()]
+
+    def render():
+        if snapshot.dates.get(day) == target.strftime('%d.%m.%Y'):
+            schedule, date = snapshot.lookup(day, group_id)
+        else:
+            schedules, date = source.archive.load_schedules(target)
+            schedule = schedules.get(group_id) if schedules else None
+        if not schedule or not any(schedule):
+            return None
+        return escape_markdown_v2("🌙 Ежедневная рассылка\n\n") + format_day_schedule(group_id, day, date, schedule)
+
+    return digest_renders.get(source.key, snapshot, (group_id, target), render)
+
+digest_renders = RenderCache()
+
+def render_now(user_id, now=None):
+    # Текущее и следующее занятие группы: звонки — бинарным поиском по таблице курса,
+    # уроки — из снимка в памяти, если в нём сегодняшняя дата, иначе из архива.
+    group_id = user_groups.get(user_id)
+    if not group_id:
+        return escape_markdown_v2("❌ Сначала выберите группу с помощью /start или /group.")
+    now = now or local_now()
+    weekday = now.weekday()
+    if weekday >= len(DAYS_ORDER):
+        return escape_markdown_v2(f"😴 Сегодня у группы *{group_id}* занятий нет.")
+    source = source_for_user(user_id)
+    snapshot = source.get_snapshot()
+    day = DAYS_ORDER[weekday]
+    if snapshot.dates.get(day) == now.strftime('%d.%m.%Y'):
+        schedule, _ = snapshot.lookup(day, group_id)
+        shadow_parser.sample_view(snapshot, day, group_id)
+    else:
+        schedules, _ = source.archive.load_schedules(now.date())
+        if schedules is None:
+            return escape_markdown_v2(f"📭 Расписание на сегодня ({now.strftime('%d.%m.%Y')}) ещё не опубликовано.")
+        schedule = schedules.get(group_id)
+    if not schedule or not any(schedule):
+        return escape_markdown_v2(f"😴 Сегодня у группы *{group_id}* занятий нет.")
+
+    def lesson_for(bell):
+        return schedule[bell.number - 1] if bell.number <= len(schedule) else None
+
+    def line(bell):
+        lesson = lesson_for(bell)
+        return f"*{bell.number} занятие* ({format_time(bell.start)}–{format_time(bell.end)}): {format_lesson(lesson.subject, lesson.rooms)}"
+
+    current, upcoming = bells_at(now, course_group_for(group_id))
+    following = next((bell for bell in upcoming if lesson_for(bell)), None)
+    response = f"⏱ Группа *{group_id}*, сейчас {format_time(now)}\n\n"
+    if current and lesson_for(current):
+        response += f"▶️ Идёт {line(current)}\n"
+    elif following:
+        response += "☕ Сейчас перерыв\n"
+    if following:
+        response += f"⏭ Далее {line(following)}\n"
+    elif not (current and lesson_for(current)):
+        response += "🏁 Занятия на сегодня закончились\n"
+    return escape_markdown_v2(response)
+
+def render_group_day(snapshot, group_id, day):
+    schedule, date = snapshot.lookup(day, group_id)
+    if not schedule or not any(schedule):
+        return escape_markdown_v2(f"❌ Группа *{group_id}* не найдена в расписании на *{day}*.")
+    return format_day_schedule(group_id, day, date, schedule)
+
+day_renders = RenderCache()
+
+def cached_group_day(source, snapshot, group_id, day):
+    return day_renders.get(source.key, snapshot, (group_id, day), lambda: render_group_day(snapshot, group_id, day))
+
+def warm_renders(source, snapshot):
+    def warm():
+        warmed = 0
+        groups = set(snapshot.groups)
+        hot_groups = []
+        for group_id, day in usage.hottest(WARM_RENDERS):
+            if group_id in groups and snapshot.has_day(day):
+                cached_group_day(source, snapshot, group_id, day)
+                warmed += 1
+                if group_id not in hot_groups:
+                    hot_groups.append(group_id)
+        # Картинки недели популярных групп рисуются в пуле timetable_media, остальные — по запросу.
+        for group_id in hot_groups:
+            media_caches[source.key].week_image(snapshot, group_id)
+        logging.info(f"Снимок {snapshot.version} источника {source.key}: прогрето отрисовок популярных дней групп: {warmed}")
+
+    threading.Thread(target=warm, daemon=True).start()
+
+def setup():
+    # Вызывается один раз из main перед register_handlers.
+    global user_groups, user_sources, edit_queue, digest_scheduler
+    with _setup_lock:
+        if user_groups is not None:
+            return
+        user_sources = open_user_sources()
+        # Правки сообщений уходят через очередь, где более новая правка того же сообщения
+        # заменяет ещё не отправленную; ответы на callback — сразу, новые сообщения в чат —
+        # после уже запрошенных правок этого чата.
+        edit_queue = EditCoalescer()
+        for source in all_sources().values():
+            # Поиск: ответы кэшируются на версию снимка. Картинки недели и исходные
+            # документы: отрисовка и file_id Telegram на версию снимка.
+            search_caches[source.key] = ResultCache()
+            media_caches[source.key] = MediaCache(DAYS_ORDER)
+            source.store.add_listener(partial(warm_renders, source))
+        digest_scheduler = DigestScheduler(open_user_digests(), render=render_digest)
+        user_groups = open_user_groups()
+
+def send_upload(bot, method, chat_id, upload, caption):
+    # Файл загружается в Telegram один раз на снимок, дальше отправляется по file_id.
+    file_id = upload.file_id
+    if file_id:
+        return retry_api_call(method, chat_id, file_id, caption=caption)
+    if not isinstance(bot, telebot.TeleBot):
+        # Асинхронный движок сам загрузит файл и запомнит file_id.
+        return retry_api_call(method, chat_id, upload, caption=caption)
+    if upload.read() is None:
+        return None
+    # Файл открывается заново на каждую попытку, поэтому вызов обёрнут в lambda, и
+    # retry_api_call не видит chat_id: порядок после правок этого чата соблюдается здесь.
+    edit_queue.wait_chat(chat_id)
+    message = retry_api_call(lambda: method(chat_id, upload.as_file(), caption=caption))
+    upload.sent(message)
+    return message
+
+def callback_kind(data):
+    # Тип нажатия для статистики: без номеров групп, страниц и дат.
+    for prefix in ('group_', 'page_', 'date_', 'source_'):
+        if data.startswith(prefix):
+            return prefix[:-1]
+    return 'day' if data in DAYS_ORDER else data[:32]
+
+def render_places(title, places):
+    response = f"🔎 *{title}*\n\n"
+    for day, group_id, number, lesson in places[:PLACES_LIMIT]:
+        response += f"*{day}*, {number} занятие — группа *{group_id}*: {format_lesson(lesson.subject, lesson.rooms)}\n"
+    if len(places) > PLACES_LIMIT:
+        response += f"\n…и ещё {len(places) - PLACES_LIMIT}"
+    return escape_markdown_v2(response)
+
+def search_results(query, source=None):
+    # Список готовых ответов (id, заголовок, описание, текст MarkdownV2) для запроса.
+    source = source or default_source()
+    search_cache = search_caches[source.key]
+    snapshot = source.get_snapshot()
+    key = normalize(query)
+    results = search_cache.get(snapshot, key)
+    if results is not None:
+        return results
+    search = search_cache.get_search(snapshot, DAYS_ORDER)
+    matches = search.search(key, limit=SEARCH_RESULTS_LIMIT)
+    results = []
+    group_id = next((value for kind, value in matches if kind == GROUP and normalize(value) == key), None)
+    if group_id:
+        for day in DAYS_ORDER:
+            if snapshot.has_day(day):
+                results.append((f"g{group_id}:{DAYS_ORDER.index(day)}", f"Группа {group_id} — {day}",
+                                snapshot.dates.get(day) or "", render_group_day(snapshot, group_id, day)))
+    else:
+        day = nearest_day(snapshot)
+        for number, (kind, value) in enumerate(matches):
+            if kind == GROUP and day:
+                results.append((f"g{value}", f"Группа {value}", day, render_group_day(snapshot, value, day)))
+            elif kind == SUBJECT:
+                places = search.places(kind, value)
+                results.append((f"s{number}", value, f"Предмет, занятий: {len(places)}",
+                                render_places(value, places)))
+            elif kind == ROOM:
+                places = search.places(kind, value)
+                results.append((f"r{number}", f"Кабинет {value}", f"Занятий: {len(places)}",
+                                render_places(f"Кабинет {value}", places)))
+    search_cache.put(snapshot, key, results)
+    return results
+
 def register_handlers(bot):
     @bot.message_handler(commands=['start'])
     def start(message):
-        groups = get_available_groups()
+        usage.record(message.from_user.id, '/start')
+        if is_multi_source() and message.from_user.id not in user_sources:
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                escape_markdown_v2("Привет! 👋 Выберите учебное заведение:"),
+                reply_markup=get_sources_keyboard(),
+                parse_mode='MarkdownV2'
+            )
+            return
+        groups = list(snapshot_for_user(message.from_user.id).groups)
         logging.debug(f"Команда /start, доступные группы: {groups}")
         if not groups:
             error_text = "❌ Не удалось найти группы. Убедитесь, что файлы расписания находятся в папке 'extracted_schedules'."
@@ -307,9 +598,21 @@ def register_handlers(bot):
             parse_mode='MarkdownV2'
         )
 
+    @bot.message_handler(commands=['source'])
+    def change_source_command(message):
+        usage.record(message.from_user.id, '/source')
+        retry_api_call(
+            bot.send_message,
+            message.chat.id,
+            escape_markdown_v2(f"🏫 Сейчас выбрано: *{source_for_user(message.from_user.id).title}*\nВыберите учебное заведение:"),
+            reply_markup=get_sources_keyboard(),
+            parse_mode='MarkdownV2'
+        )
+
     @bot.message_handler(commands=['group'])
     def change_group_command(message):
-        groups = get_available_groups()
+        usage.record(message.from_user.id, '/group')
+        groups = list(snapshot_for_user(message.from_user.id).groups)
         logging.debug(f"Команда /group, доступные группы: {groups}")
         if not groups:
             retry_api_call(
@@ -327,48 +630,176 @@ def register_handlers(bot):
             parse_mode='MarkdownV2'
         )
 
+    @bot.message_handler(commands=['digest'])
+    def digest_command(message):
+        user_id = message.from_user.id
+        usage.record(user_id, '/digest')
+        parts = message.text.split(maxsplit=1)
+        argument = parts[1].strip() if len(parts) > 1 else ''
+        if argument.lower() in ('off', 'выкл', 'стоп'):
+            digest_scheduler.unsubscribe(user_id)
+            text = "🔕 Ежедневная рассылка отключена."
+        elif not argument:
+            minute = digest_scheduler.subscription(user_id)
+            text = (f"🔔 Рассылка включена на {format_minute(minute)}. Отключить: /digest off"
+                    if minute is not None else
+                    "🔔 Расписание на следующий день каждый вечер: /digest 20:00\nОтключить: /digest off")
+        elif not user_groups.get(user_id):
+            text = "❌ Сначала выберите группу с помощью /start или /group."
+        else:
+            minute = parse_digest_time(argument)
+            if minute is None:
+                text = "❌ Укажите время в формате ЧЧ:ММ, например /digest 20:00"
+            else:
+                digest_scheduler.subscribe(user_id, minute)
+                text = f"✅ Каждый день в {format_minute(minute)} пришлю расписание на следующий учебный день."
+        retry_api_call(
+            bot.send_message,
+            message.chat.id,
+            escape_markdown_v2(text),
+            parse_mode='MarkdownV2'
+        )
+
+    @bot.message_handler(commands=['now'])
+    def now_command(message):
+        usage.record(message.from_user.id, '/now')
+        retry_api_call(
+            bot.send_message,
+            message.chat.id,
+            render_now(message.from_user.id),
+            reply_markup=get_days_keyboard(),
+            parse_mode='MarkdownV2'
+        )
+
+    @bot.message_handler(commands=['date'])
+    def date_command(message):
+        usage.record(message.from_user.id, '/date')
+        schedule_date = parse_date_argument(message.text)
+        if not schedule_date:
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                escape_markdown_v2("📆 Укажите дату: /date 27.10 или /date 27.10.2025"),
+                parse_mode='MarkdownV2'
+            )
+            return
+        group_id = user_groups.get(message.from_user.id)
+        if not group_id:
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                escape_markdown_v2("❌ Сначала выберите группу с помощью /start или /group."),
+                parse_mode='MarkdownV2'
+            )
+            return
+        retry_api_call(
+            bot.send_message,
+            message.chat.id,
+            render_date_schedule(schedule_date, group_id, source_for_user(message.from_user.id).archive),
+            parse_mode='MarkdownV2'
+        )
+
+    @bot.inline_handler(func=lambda query: True)
+    def inline_search(query):
+        usage.record(query.from_user.id, 'inline')
+        source = source_for_user(query.from_user.id)
+        snapshot = source.get_snapshot()
+        key = normalize(query.query)
+        group_id = next((group for group in snapshot.groups if normalize(group) == key), None)
+        day = nearest_day(snapshot)
+        if group_id and day:
+            shadow_parser.sample_view(snapshot, day, group_id)
+        results = [
+            InlineQueryResultArticle(
+                id=result_id,
+                title=title,
+                description=description,
+                input_message_content=InputTextMessageContent(text, parse_mode='MarkdownV2')
+            )
+            for result_id, title, description, text in search_results(query.query, source)
+        ]
+        logging.debug(f"Inline-запрос '{query.query}': {len(results)} результатов")
+        retry_api_call(bot.answer_inline_query, query.id, results, cache_time=INLINE_CACHE_TIME)
+
+    @bot.message_handler(content_types=['text'], func=lambda message: not message.text.startswith('/'))
+    def text_search(message):
+        source = source_for_user(message.from_user.id)
+        snapshot = source.get_snapshot()
+        key = normalize(message.text)
+        group_id = next((group for group in snapshot.groups if normalize(group) == key), None)
+        if group_id:
+            user_groups[message.from_user.id] = group_id
+            day = nearest_day(snapshot)
+            usage.record(message.from_user.id, 'search', group_id, day)
+            if day:
+                shadow_parser.sample_view(snapshot, day, group_id)
+            text = (cached_group_day(source, snapshot, group_id, day) if day else
+                    escape_markdown_v2(f"✅ Группа установлена: *{group_id}*"))
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                text,
+                reply_markup=get_days_keyboard(),
+                parse_mode='MarkdownV2'
+            )
+            return
+        usage.record(message.from_user.id, 'search')
+        results = search_results(message.text, source)
+        groups = [result_id[1:] for result_id, _, _, _ in results if result_id.startswith('g')]
+        if groups and len(groups) == len(results):
+            keyboard = InlineKeyboardMarkup(row_width=3)
+            keyboard.add(*[InlineKeyboardButton(group, callback_data=f"group_{group}_lessons") for group in groups])
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                escape_markdown_v2("👥 Найдено несколько групп, выберите свою:"),
+                reply_markup=keyboard,
+                parse_mode='MarkdownV2'
+            )
+        elif results:
+            retry_api_call(bot.send_message, message.chat.id, results[0][3], parse_mode='MarkdownV2')
+        else:
+            retry_api_call(
+                bot.send_message,
+                message.chat.id,
+                escape_markdown_v2("🔎 Ничего не найдено. Введите номер группы, предмет или кабинет."),
+                parse_mode='MarkdownV2'
+            )
+
     @bot.callback_query_handler(func=lambda call: True)
     def callback_handler(call):
         retry_api_call(bot.answer_callback_query, call.id)
         logging.debug(f"Получены callback-данные: {call.data}")
+        # Группа нужна статистике только для просмотров дня.
+        viewed_day = call.data if call.data in DAYS_ORDER else None
+        usage.record(call.from_user.id, callback_kind(call.data),
+                     user_groups.get(call.from_user.id) if viewed_day else None, viewed_day)
         if call.data == "bells":
-            bells_schedule = (
-                "<b>🔔 Расписание звонков 🔔</b>\n\n"
-                "<b>1 Занятие</b>: 8:30 - 9:15\n\n"
-                "<b>2 Занятие</b>: 9:25 - 10:10\n\n"
-                "<b>3 Занятие</b>: 10:20 - 11:05\n\n"
-                "<b>4 Занятие</b>: 11:15 - 12:00\n\n"
-                "<b>* Большой перерыв (1-2 курс)</b>\n\n"
-                "<b>5 Занятие (1-2 курс)</b>: 12:55 - 13:40\n"
-                "<b>5 Занятие (3-4 курс)</b>: 12:10 - 12:55\n\n"
-                "<b>* Большой перерыв (3-4 курс)</b>\n\n"
-                "<b>6 Занятие</b>: 13:50 - 14:35\n\n"
-                "<b>7 Занятие</b>: 14:45 - 15:30\n\n"
-                "<b>8 Занятие</b>: 15:40 - 16:25\n\n"
-                "<b>9 Занятие</b>: 16:35 - 17:20\n\n"
-                "<b>10 Занятие</b>: 17:30 - 18:15"
-            )
+            bells_schedule = format_bells_html()
             logging.debug(f"bells_schedule before sending: {bells_schedule}")
-            try:
-                retry_api_call(
-                    bot.edit_message_text,
-                    chat_id=call.message.chat.id,
-                    message_id=call.message.message_id,
-                    text=bells_schedule,
-                    reply_markup=InlineKeyboardMarkup().add(
-                        InlineKeyboardButton("🔙 Вернуться назад", callback_data="back_main")),
-                    parse_mode='HTML'
-                )
-            except Exception as e:
+            chat_id = call.message.chat.id
+
+            def bells_failed(e):
                 logging.error(f"Ошибка при отправке bells_schedule: {e}")
                 retry_api_call(
                     bot.send_message,
-                    call.message.chat.id,
+                    chat_id,
                     text=escape_markdown_v2("❌ Ошибка при отображении расписания звонков\. Попробуйте позже\."),
                     parse_mode='MarkdownV2'
                 )
+
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=chat_id,
+                message_id=call.message.message_id,
+                text=bells_schedule,
+                reply_markup=InlineKeyboardMarkup().add(
+                    InlineKeyboardButton("🔙 Вернуться назад", callback_data="back_main")),
+                parse_mode='HTML',
+                on_error=bells_failed
+            )
         elif call.data == "lessons":
-            groups = get_available_groups()
+            groups = list(snapshot_for_user(call.from_user.id).groups)
             logging.debug(f"Callback 'lessons', доступные группы: {groups}")
             if not groups:
                 retry_api_call(
@@ -399,7 +830,7 @@ def register_handlers(bot):
                     parse_mode='MarkdownV2'
                 )
         elif call.data == "select_group":
-            groups = get_available_groups()
+            groups = list(snapshot_for_user(call.from_user.id).groups)
             logging.debug(f"Callback 'select_group', доступные группы: {groups}")
             if not groups:
                 retry_api_call(
@@ -468,7 +899,7 @@ def register_handlers(bot):
                 return
             page = int(parts[1])
             context = parts[2]
-            groups = get_available_groups()
+            groups = list(snapshot_for_user(call.from_user.id).groups)
             logging.debug(f"Переключение страницы, page: {page}, context: {context}, группы: {groups}")
             if not groups:
                 retry_api_call(
@@ -488,7 +919,7 @@ def register_handlers(bot):
                 parse_mode='MarkdownV2'
             )
         elif call.data == "change_group":
-            groups = get_available_groups()
+            groups = list(snapshot_for_user(call.from_user.id).groups)
             logging.debug(f"Callback 'change_group', доступные группы: {groups}")
             if not groups:
                 retry_api_call(
@@ -506,6 +937,105 @@ def register_handlers(bot):
                 reply_markup=get_groups_keyboard(groups, context="change_group", page=1),
                 parse_mode='MarkdownV2'
             )
+        elif call.data == "select_source":
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=escape_markdown_v2("🏫 Выберите учебное заведение:"),
+                reply_markup=get_sources_keyboard(),
+                parse_mode='MarkdownV2'
+            )
+        elif call.data.startswith("source_"):
+            source = all_sources().get(call.data[len("source_"):])
+            if not source:
+                logging.error(f"Неизвестный источник в callback-данных: {call.data}")
+                return
+            user_id = call.from_user.id
+            if user_sources.get(user_id) != source.key:
+                # Номера групп у разных учебных заведений не связаны, поэтому группу выбираем заново.
+                user_sources[user_id] = source.key
+                user_groups.pop(user_id, None)
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=escape_markdown_v2(f"✅ Выбрано: *{source.title}*\nВыберите опцию:"),
+                reply_markup=get_main_keyboard(),
+                parse_mode='MarkdownV2'
+            )
+        elif call.data == "dates":
+            keyboard, dates = get_dates_keyboard(archive=source_for_user(call.from_user.id).archive)
+            text = "📆 Выберите дату:" if dates else "❌ В архиве пока нет расписаний."
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=escape_markdown_v2(text),
+                reply_markup=keyboard,
+                parse_mode='MarkdownV2'
+            )
+        elif call.data.startswith("date_"):
+            user_id = call.from_user.id
+            if user_id not in user_groups:
+                retry_api_call(
+                    bot.send_message,
+                    call.message.chat.id,
+                    escape_markdown_v2("❌ Сначала выберите группу с помощью /start или /group."),
+                    parse_mode='MarkdownV2'
+                )
+                return
+            try:
+                schedule_date = datetime.strptime(call.data[len("date_"):], "%Y-%m-%d").date()
+            except ValueError:
+                logging.error(f"Неверный формат даты в callback-данных: {call.data}")
+                return
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=render_date_schedule(schedule_date, user_groups[user_id], source_for_user(user_id).archive),
+                reply_markup=get_dates_keyboard(archive=source_for_user(user_id).archive)[0],
+                parse_mode='MarkdownV2'
+            )
+        elif call.data in ("week_image", "document"):
+            user_id = call.from_user.id
+            group_id = user_groups.get(user_id)
+            if not group_id:
+                retry_api_call(
+                    bot.send_message,
+                    call.message.chat.id,
+                    escape_markdown_v2("❌ Сначала выберите группу с помощью /start или /group."),
+                    parse_mode='MarkdownV2'
+                )
+                return
+            source = source_for_user(user_id)
+            snapshot = source.get_snapshot()
+            media = media_caches[source.key]
+            if call.data == "week_image":
+                sent = send_upload(bot, bot.send_photo, call.message.chat.id, media.week_upload(snapshot, group_id),
+                                   f"🖼 Расписание группы {group_id} на неделю")
+            else:
+                day = nearest_day(snapshot)
+                upload = media.document_upload(snapshot, day) if day else None
+                sent = upload and send_upload(bot, bot.send_document, call.message.chat.id, upload,
+                                              f"📄 Расписание колледжа: {day} {snapshot.dates.get(day) or ''}".strip())
+            if not sent:
+                retry_api_call(
+                    bot.send_message,
+                    call.message.chat.id,
+                    escape_markdown_v2("❌ Файл сейчас недоступен. Попробуйте позже."),
+                    parse_mode='MarkdownV2'
+                )
+        elif call.data == "now":
+            retry_api_call(
+                bot.edit_message_text,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=render_now(call.from_user.id),
+                reply_markup=get_days_keyboard(),
+                parse_mode='MarkdownV2'
+            )
         elif call.data == "back_main":
             retry_api_call(
                 bot.edit_message_text,
@@ -527,45 +1057,20 @@ def register_handlers(bot):
                 )
                 return
             group_id = user_groups[user_id]
-            schedules_folder = "extracted_schedules"
-            available_schedules = get_schedule_files(schedules_folder)
-            logging.debug(f"Callback для дня: {day}, группа: {group_id}, доступные файлы: {available_schedules}")
-            if day in available_schedules:
-                selected_file = available_schedules[day]
-                logging.debug(f"Выбран файл для дня {day}: {selected_file}")
-                schedule, date = parse_schedule(selected_file, group_id)
-                if schedule:
-                    response = f"📚 Расписание для группы *{group_id}* на *{day}* ({date}):\n\n"
-                    for idx, lesson in enumerate(schedule, start=1):
-                        if lesson:
-                            parts = lesson.split(' – ')
-                            if len(parts) == 2:
-                                subject, room = parts
-                                response += f"*{idx}.* {subject} – *{room}*\n"
-                            else:
-                                response += f"*{idx}.* {lesson}\n"
-                        else:
-                            response += f"*{idx}.* Нет урока\n"
-                    escaped_response = escape_markdown_v2(response)
-                    logging.debug(f"Сформированный response: {escaped_response}")
-                    retry_api_call(
-                        bot.edit_message_text,
-                        chat_id=call.message.chat.id,
-                        message_id=call.message.message_id,
-                        text=escaped_response,
-                        reply_markup=get_days_keyboard(),
-                        parse_mode='MarkdownV2'
-                    )
-                else:
-                    logging.warning(f"Не удалось найти расписание для группы {group_id} на {day}")
-                    retry_api_call(
-                        bot.edit_message_text,
-                        chat_id=call.message.chat.id,
-                        message_id=call.message.message_id,
-                        text=escape_markdown_v2(f"❌ Группа *{group_id}* не найдена в расписании на *{day}*."),
-                        reply_markup=get_days_keyboard(),
-                        parse_mode='MarkdownV2'
-                    )
+            source = source_for_user(user_id)
+            snapshot = source.get_snapshot()
+            logging.debug(f"Callback для дня: {day}, группа: {group_id}, версия снимка: {snapshot.version}")
+            if snapshot.has_day(day):
+                shadow_parser.sample_view(snapshot, day, group_id)
+                # Готовый текст из кэша отрисовок снимка; популярные дни прогреты заранее.
+                retry_api_call(
+                    bot.edit_message_text,
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=cached_group_day(source, snapshot, group_id, day),
+                    reply_markup=get_days_keyboard(),
+                    parse_mode='MarkdownV2'
+                )
             else:
                 logging.warning(f"Файл расписания для дня {day} не найден")
                 retry_api_call(
@@ -578,11 +1083,23 @@ def register_handlers(bot):
                 )
 
 if __name__ == "__main__":
+    # Импорт модуля ничего не настраивает: бот, токен, логирование и хранилища создаются
+    # только при запуске напрямую (или в main через setup()).
+    from dotenv import load_dotenv
+
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    BOT_TOKEN = os.getenv("BOT_TOKEN")
+    if not BOT_TOKEN:
+        logging.error("BOT_TOKEN не найден в переменных окружения")
+        raise ValueError("BOT_TOKEN не найден")
+    bot = telebot.TeleBot(BOT_TOKEN)
     logging.info("Бот запущен...")
+    setup()
     register_handlers(bot)
-    groups = get_available_groups()
+    groups = default_source().get_snapshot().groups
     if groups:
         logging.info(f"Доступные группы: {', '.join(groups)}")
     else:
-        logging.warning("Группы не найдены. Проверьте папку 'extracted_schedules'.")
+        logging.warning("Группы не найдены: нет опубликованного снимка расписания.")
     bot.polling(none_stop=True)
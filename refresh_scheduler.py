@@ -0,0 +1,172 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+
+import requests
+
+from bells import local_now
+
+REQUEST_TIMEOUT = 30
+JITTER = 0.15
+BACKOFF_FACTOR = 1.5
+# Страховка на случай, если сайт не отдаёт валидаторов документов: полное обновление
+# не реже чем раз в столько секунд, даже если проверка изменений ничего не нашла.
+FORCED_REFRESH_INTERVAL = float(os.getenv('FORCED_REFRESH_INTERVAL', 6 * 60 * 60))
+DOCUMENT_VALIDATORS = ('ETag', 'Last-Modified', 'Content-Length')
+
+# (начало часа, конец часа, базовый интервал, максимальный интервал) в секундах.
+# Колледж выкладывает изменения вечером и рано утром, ночью и днём опрашиваем реже.
+POLL_PERIODS = [
+    (0, 6, 30 * 60, 120 * 60),
+    (6, 9, 5 * 60, 15 * 60),
+    (9, 16, 15 * 60, 60 * 60),
+    (16, 24, 5 * 60, 20 * 60),
+]
+
+
+def poll_period(now, periods=POLL_PERIODS):
+    for start, end, base, maximum in periods:
+        if start <= now.hour < end:
+            return base, maximum
+    return periods[-1][2], periods[-1][3]
+
+
+class ChangeDetector:
+    # Дешёвая проверка: условный GET страницы, список ссылок на документы (счётчики и баннеры
+    # на странице не считаются изменением) и HEAD каждого документа — колледж часто
+    # перезаливает исправленное расписание под тем же именем.
+    def __init__(self, site_url):
+        self.site_url = site_url
+        self.etag = None
+        self.last_modified = None
+        self.links = []
+        self.fingerprint = None
+        # Валидаторы и ссылки ответа 200 ждут commit: пока изменение не обработано, условный
+        # GET идёт со старыми валидаторами, и 304 не скроет необработанный список ссылок.
+        self.pending_pages = {}
+        self.session = requests.Session()
+
+    def fetch_links(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        response = self.session.get(self.site_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return self.links, None
+        response.raise_for_status()
+
+        from bs4 import BeautifulSoup
+        from get_schedule import find_schedule_links
+
+        links = find_schedule_links(BeautifulSoup(response.text, 'html.parser'), self.site_url, verbose=False)
+        hrefs = sorted(href for file_name, href, file_date in links)
+        return hrefs, (response.headers.get('ETag'), response.headers.get('Last-Modified'), hrefs)
+
+    def document_validators(self, href):
+        # Без валидаторов (HEAD не поддерживается или упал) документ учитывается только ссылкой.
+        try:
+            response = self.session.head(href, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            logging.warning(f"HEAD {href} не удался: {e}")
+            return ''
+        if response.status_code != 200:
+            return ''
+        return '|'.join(response.headers.get(name, '') for name in DOCUMENT_VALIDATORS)
+
+    def fetch_fingerprint(self):
+        hrefs, page = self.fetch_links()
+        digest = hashlib.sha256()
+        for href in hrefs:
+            digest.update(href.encode('utf-8'))
+            digest.update(b'\t')
+            digest.update(self.document_validators(href).encode('utf-8'))
+            digest.update(b'\n')
+        fingerprint = digest.hexdigest()
+        if page is not None:
+            self.pending_pages = {fingerprint: page}
+        return fingerprint
+
+    def check(self):
+        fingerprint = self.fetch_fingerprint()
+        return fingerprint != self.fingerprint, fingerprint
+
+    def commit(self, fingerprint):
+        self.fingerprint = fingerprint
+        if fingerprint in self.pending_pages:
+            self.etag, self.last_modified, self.links = self.pending_pages.pop(fingerprint)
+
+
+class AdaptiveScheduler:
+    def __init__(self, detector, on_change, should_poll=None, periods=POLL_PERIODS,
+                 forced_interval=FORCED_REFRESH_INTERVAL):
+        self.detector = detector
+        self.periods = periods
+        self.on_change = on_change
+        self.should_poll = should_poll or (lambda: True)
+        self.forced_interval = forced_interval
+        self.last_refresh = time.monotonic()
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.unchanged_checks = 0
+
+    def next_interval(self, now=None):
+        base, maximum = poll_period(now or local_now(), self.periods)
+        interval = min(base * BACKOFF_FACTOR ** self.unchanged_checks, maximum)
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def prime(self):
+        self.last_refresh = time.monotonic()
+        try:
+            changed, fingerprint = self.detector.check()
+            self.detector.commit(fingerprint)
+        except Exception as e:
+            logging.error(f"Ошибка при первичной проверке страницы расписания: {e}")
+
+    def refresh_due(self):
+        return time.monotonic() - self.last_refresh >= self.forced_interval
+
+    def poll_once(self):
+        try:
+            changed, fingerprint = self.detector.check()
+        except Exception as e:
+            logging.error(f"Ошибка при проверке страницы расписания: {e}")
+            if not self.refresh_due():
+                return False
+            changed, fingerprint = True, None
+        if not changed and not self.refresh_due():
+            self.unchanged_checks += 1
+            logging.debug(f"Страница расписания не изменилась (проверок без изменений: {self.unchanged_checks})")
+            return False
+        if changed:
+            logging.info(f"Обнаружено изменение страницы расписания {self.detector.site_url}, запускаем обновление")
+        else:
+            logging.info(f"Изменений {self.detector.site_url} не было {self.forced_interval:.0f} с, плановое обновление")
+        if self.on_change():
+            if fingerprint is not None:
+                self.detector.commit(fingerprint)
+            self.last_refresh = time.monotonic()
+            self.unchanged_checks = 0
+        return True
+
+    def trigger(self):
+        self.wake_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            interval = self.next_interval()
+            logging.debug(f"Следующая проверка страницы расписания через {interval:.0f} с")
+            self.wake_event.wait(interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            if self.should_poll():
+                self.poll_once()
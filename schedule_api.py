@@ -0,0 +1,153 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+
+from flask import Blueprint, Response, abort, request
+
+from sources import all_sources, default_source
+
+API_MAX_AGE = int(os.getenv('API_MAX_AGE', 60))
+DAY_KEYS = {
+    'monday': 'Понедельник',
+    'tuesday': 'Вторник',
+    'wednesday': 'Среда',
+    'thursday': 'Четверг',
+    'friday': 'Пятница',
+    'saturday': 'Суббота',
+}
+
+api = Blueprint('schedule_api', __name__)
+
+# Готовые ответы текущих снимков: источник -> (версия, {путь: (тело, gzip-тело, ETag, статус)}).
+# При смене версии кэш источника сбрасывается целиком; ответы 404 не кэшируются.
+_responses = {}
+_responses_lock = threading.Lock()
+
+
+def snapshot_tag(snapshot):
+    return snapshot.version or "legacy"
+
+
+def lessons_payload(lessons):
+    return [
+        {'number': number, 'subject': lesson.subject, 'rooms': lesson.rooms} if lesson else None
+        for number, lesson in enumerate(lessons, start=1)
+    ]
+
+
+def resolve_day(day):
+    return DAY_KEYS.get(day.lower(), day)
+
+
+def build_payload(snapshot, path_key):
+    kind = path_key[0]
+    if kind == 'groups':
+        return 200, {'version': snapshot.version, 'groups': list(snapshot.groups)}
+    group = path_key[1]
+    if group not in snapshot.groups:
+        return 404, {'error': 'group_not_found', 'group': group}
+    if kind == 'group':
+        days = {}
+        for day in DAY_KEYS.values():
+            if not snapshot.has_day(day):
+                continue
+            lessons, date = snapshot.lookup(day, group)
+            days[day] = {'date': date, 'lessons': lessons_payload(lessons) if lessons else []}
+        return 200, {'version': snapshot.version, 'group': group, 'days': days}
+    day = path_key[2]
+    if not snapshot.has_day(day):
+        return 404, {'error': 'day_not_found', 'group': group, 'day': day}
+    lessons, date = snapshot.lookup(day, group)
+    return 200, {'version': snapshot.version, 'group': group, 'day': day, 'date': date,
+                 'lessons': lessons_payload(lessons) if lessons else []}
+
+
+def resolve_source(key):
+    # Без сегмента источника — первый источник; неизвестный источник — 404, а не подмена.
+    if key is None:
+        return default_source()
+    source = all_sources().get(key)
+    if source is None:
+        abort(404)
+    return source
+
+
+def cached_response(source, path_key):
+    snapshot = source.get_snapshot()
+    version = snapshot_tag(snapshot)
+    cached_version, entries = _responses.get(source.key, (None, {}))
+    entry = entries.get(path_key) if cached_version == version else None
+    if entry is None:
+        status, payload = build_payload(snapshot, path_key)
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        etag = f"{version}-{digest}"
+        entry = (body, gzip.compress(body, compresslevel=9, mtime=0), etag, status)
+        if status != 200:
+            return entry
+        with _responses_lock:
+            cached_version, entries = _responses.get(source.key, (None, {}))
+            if cached_version != version:
+                if source.get_snapshot() is not snapshot:
+                    return entry
+                logging.info(f"API: новый снимок {version} источника {source.key}, кэш ответов сброшен")
+                entries = {}
+                _responses[source.key] = (version, entries)
+            entries[path_key] = entry
+    return entry
+
+
+def accepts_gzip():
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def etag_matches(etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or f'"{etag}"' in candidates
+
+
+def json_response(source_key, path_key):
+    body, gzip_body, etag, status = cached_response(resolve_source(source_key), path_key)
+    use_gzip = accepts_gzip()
+    # Сжатое и несжатое представления — разные байты, поэтому у них разные сильные ETag.
+    if use_gzip:
+        etag = f"{etag}-gz"
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f"public, max-age={API_MAX_AGE}",
+        'Vary': 'Accept-Encoding',
+    }
+    if status == 200 and etag_matches(etag):
+        return Response(status=304, headers=headers)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        body = gzip_body
+    return Response(body, status=status, headers=headers, content_type='application/json; charset=utf-8')
+
+
+@api.route('/api/groups')
+@api.route('/api/<source>/groups')
+def groups_route(source=None):
+    return json_response(source, ('groups',))
+
+
+@api.route('/api/schedule/<group>')
+@api.route('/api/<source>/schedule/<group>')
+def group_schedule_route(group, source=None):
+    return json_response(source, ('group', group.strip()))
+
+
+@api.route('/api/schedule/<group>/<day>')
+@api.route('/api/<source>/schedule/<group>/<day>')
+def day_schedule_route(group, day, source=None):
+    return json_response(source, ('day', group.strip(), resolve_day(day)))
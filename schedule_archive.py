@@ -0,0 +1,205 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from schedule_model import DaySchedule, LessonPool
+
+ARCHIVE_DIR = os.getenv('SCHEDULE_ARCHIVE_DIR', os.path.join(os.getenv('SNAPSHOTS_DIR', 'snapshots'), '.archive'))
+RETENTION_DAYS = int(os.getenv('SCHEDULE_RETENTION_DAYS', 120))
+INDEX_FILE = "index.json"
+OBJECTS_SUBDIR = "objects"
+# Документ, который libreoffice не смог прочитать столько раз, больше не конвертируется.
+EXTRACT_ATTEMPTS = 3
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def date_key(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat()
+
+
+class ScheduleArchive:
+    # Документы и извлечённый текст хранятся по хешу содержимого (одинаковые файлы — один объект),
+    # а индекс связывает настоящую дату расписания с объектами:
+    #   {"dates": {"2025-10-20": {"doc": sha, "ext": ".doc", "name": "..."}}, "texts": {doc_sha: txt_sha},
+    #    "failed": {doc_sha: неудачных попыток извлечения}}
+    def __init__(self, root=ARCHIVE_DIR, retention_days=RETENTION_DAYS):
+        self.root = root
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    def object_path(self, sha, ext):
+        return os.path.join(self.root, OBJECTS_SUBDIR, sha[:2], sha + ext)
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        except ValueError as e:
+            logging.error(f"Повреждён индекс архива {self.index_path}: {e}")
+            index = {}
+        index.setdefault('dates', {})
+        index.setdefault('texts', {})
+        index.setdefault('failed', {})
+        return index
+
+    def _save_index(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        index['dates'] = dict(sorted(index['dates'].items()))
+        tmp_path = f"{self.index_path}.part"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    def _store_object(self, sha, ext, write):
+        path = self.object_path(sha, ext)
+        if os.path.exists(path):
+            return path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        return path, True
+
+    def put_document(self, schedule_date, content, ext, source_name):
+        sha = hashlib.sha256(content).hexdigest()
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+
+        path, created = self._store_object(sha, ext, write)
+        key = date_key(schedule_date)
+        with self._lock:
+            index = self.load_index()
+            previous = index['dates'].get(key)
+            if not previous or previous.get('doc') != sha:
+                index['dates'][key] = {'doc': sha, 'ext': ext, 'name': source_name}
+                self._save_index(index)
+                logging.info(f"Архив: дата {key} -> {sha[:12]} ({'новый объект' if created else 'дубликат'})")
+        return sha
+
+    def text_for_document(self, doc_sha):
+        txt_sha = self.load_index()['texts'].get(doc_sha)
+        if txt_sha:
+            path = self.object_path(txt_sha, '.txt')
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put_text(self, doc_sha, txt_path):
+        txt_sha = file_sha256(txt_path)
+        self._store_object(txt_sha, '.txt', lambda tmp_path: shutil.copyfile(txt_path, tmp_path))
+        with self._lock:
+            index = self.load_index()
+            if index['texts'].get(doc_sha) != txt_sha or doc_sha in index['failed']:
+                index['texts'][doc_sha] = txt_sha
+                index['failed'].pop(doc_sha, None)
+                self._save_index(index)
+        return txt_sha
+
+    def mark_failed(self, doc_sha):
+        with self._lock:
+            index = self.load_index()
+            attempts = index['failed'].get(doc_sha, 0) + 1
+            index['failed'][doc_sha] = attempts
+            self._save_index(index)
+        return attempts
+
+    def dates(self):
+        return [date.fromisoformat(key) for key in self.load_index()['dates']]
+
+    def entry(self, schedule_date):
+        return self.load_index()['dates'].get(date_key(schedule_date))
+
+    def document_path(self, schedule_date):
+        entry = self.entry(schedule_date)
+        return self.object_path(entry['doc'], entry['ext']) if entry else None
+
+    def text_path(self, schedule_date):
+        entry = self.entry(schedule_date)
+        return self.text_for_document(entry['doc']) if entry else None
+
+    def pending_documents(self, max_attempts=EXTRACT_ATTEMPTS):
+        index = self.load_index()
+        return [(key, entry) for key, entry in index['dates'].items()
+                if entry['doc'] not in index['texts'] and index['failed'].get(entry['doc'], 0) < max_attempts]
+
+    def apply_retention(self, today=None):
+        today = today or date.today()
+        cutoff = date_key(today - timedelta(days=self.retention_days))
+        with self._lock:
+            index = self.load_index()
+            expired = [key for key in index['dates'] if key < cutoff]
+            for key in expired:
+                del index['dates'][key]
+            live_docs = {entry['doc'] for entry in index['dates'].values()}
+            index['texts'] = {doc: txt for doc, txt in index['texts'].items() if doc in live_docs}
+            index['failed'] = {doc: attempts for doc, attempts in index['failed'].items() if doc in live_docs}
+            self._save_index(index)
+        live_objects = live_docs | set(index['texts'].values())
+        removed = 0
+        objects_dir = os.path.join(self.root, OBJECTS_SUBDIR)
+        for dirpath, dirnames, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                sha = filename.split('.', 1)[0]
+                if sha not in live_objects:
+                    os.remove(os.path.join(dirpath, filename))
+                    removed += 1
+        if expired or removed:
+            logging.info(f"Архив: удалено дат {len(expired)}, объектов {removed}")
+        return expired
+
+    def load_schedules(self, schedule_date):
+        path = self.text_path(schedule_date)
+        if not path:
+            return None, None
+        return _parse_archived_text(path)
+
+
+_archive_pool = LessonPool()
+
+
+@lru_cache(maxsize=32)
+def _parse_archived_text(path):
+    # Объект адресуется хешем содержимого, поэтому результат разбора никогда не устаревает.
+    from parse_schedule import parse_schedule_file
+    schedules, date = parse_schedule_file(path, structured=True)
+    if schedules is None:
+        return None, None
+    return DaySchedule.from_groups(_archive_pool, date, schedules), date
+
+
+def pick_weekday_dates(dates, today=None):
+    # Для каждого дня недели показываем ближайшую дату не раньше сегодняшней,
+    # а если таких нет — самую позднюю из прошедших.
+    today = today or date.today()
+    by_weekday = {}
+    for value in dates:
+        by_weekday.setdefault(value.weekday(), []).append(value)
+    picked = {}
+    for weekday, candidates in by_weekday.items():
+        upcoming = [d for d in candidates if d >= today]
+        picked[weekday] = min(upcoming) if upcoming else max(candidates)
+    return picked
+
+
+default_archive = ScheduleArchive()
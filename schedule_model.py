@@ -0,0 +1,112 @@
+import sys
+from array import array
+
+
+def format_lesson(subject, rooms):
+    return f"{subject} – {rooms} каб." if rooms else subject
+
+
+class Lesson:
+    # Запись урока для отображения; создаётся при обращении из идентификаторов в таблицах,
+    # сами строки предметов и кабинетов хранятся по одному разу в LessonPool.
+    __slots__ = ('subject', 'rooms')
+
+    def __init__(self, subject, rooms):
+        self.subject = subject
+        self.rooms = rooms
+
+    def __bool__(self):
+        return bool(self.subject or self.rooms)
+
+    def __str__(self):
+        return format_lesson(self.subject, self.rooms)
+
+    def __repr__(self):
+        return f"Lesson({self.subject!r}, {self.rooms!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Lesson) and (self.subject, self.rooms) == (other.subject, other.rooms)
+
+    def __hash__(self):
+        return hash((self.subject, self.rooms))
+
+
+class StringTable:
+    def __init__(self):
+        self.strings = ['']
+        self._ids = {'': 0}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, text):
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            text = sys.intern(text)
+            self.strings.append(text)
+            self._ids[text] = string_id
+        return string_id
+
+
+class LessonPool:
+    # Общие таблицы предметов и кабинетов для всех дней снимка.
+    def __init__(self):
+        self.subjects = StringTable()
+        self.rooms = StringTable()
+
+    def lesson(self, subject_id, room_id):
+        return Lesson(self.subjects.strings[subject_id], self.rooms.strings[room_id])
+
+
+def _id_array(table, ids):
+    return array('H' if len(table) <= 0xFFFF else 'I', ids)
+
+
+class DaySchedule:
+    # Уроки всех групп одного дня в колонках: subject_ids/room_ids — идентификаторы подряд,
+    # offsets[row]:offsets[row + 1] — срез строки группы с номером row.
+    __slots__ = ('pool', 'date', 'group_index', 'offsets', 'subject_ids', 'room_ids')
+
+    def __init__(self, pool, date, group_index, offsets, subject_ids, room_ids):
+        self.pool = pool
+        self.date = date
+        self.group_index = group_index
+        self.offsets = offsets
+        self.subject_ids = subject_ids
+        self.room_ids = room_ids
+
+    @classmethod
+    def from_groups(cls, pool, date, groups):
+        group_index = {}
+        offsets = array('I', [0])
+        subject_ids = []
+        room_ids = []
+        for group, lessons in groups.items():
+            group_index[sys.intern(group)] = len(group_index)
+            for subject, rooms in lessons:
+                subject_ids.append(pool.subjects.intern(subject))
+                room_ids.append(pool.rooms.intern(rooms))
+            offsets.append(len(subject_ids))
+        return cls(pool, date, group_index, offsets,
+                   _id_array(pool.subjects, subject_ids), _id_array(pool.rooms, room_ids))
+
+    def __contains__(self, group):
+        return group in self.group_index
+
+    def groups(self):
+        return self.group_index.keys()
+
+    def get(self, group):
+        row = self.group_index.get(group)
+        if row is None:
+            return None
+        start, end = self.offsets[row], self.offsets[row + 1]
+        subjects = self.pool.subjects.strings
+        rooms = self.pool.rooms.strings
+        return tuple(Lesson(subjects[s], rooms[r])
+                     for s, r in zip(self.subject_ids[start:end], self.room_ids[start:end]))
+
+    def items(self):
+        for group in self.group_index:
+            yield group, self.get(group)
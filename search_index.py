@@ -0,0 +1,113 @@
+import re
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+GROUP = 'group'
+SUBJECT = 'subject'
+ROOM = 'room'
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', (text or '').strip().lower().replace('ё', 'е'))
+
+
+class PrefixIndex:
+    # Отсортированный список ключей: все ключи с данным префиксом лежат подряд,
+    # начало диапазона находится бинарным поиском.
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda entry: (entry[0], entry[1], entry[2]))
+        self.keys = [entry[0] for entry in entries]
+        self.targets = [(entry[1], entry[2]) for entry in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=50):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(found) < limit:
+            target = self.targets[i]
+            if target not in seen:
+                seen.add(target)
+                found.append(target)
+            i += 1
+        return found
+
+
+class SnapshotSearch:
+    def __init__(self, snapshot, days_order):
+        self.version = snapshot.version
+        # (тип, значение) -> список мест (день, группа, номер занятия) для предметов и кабинетов.
+        self.occurrences = {}
+        self.groups = PrefixIndex([(normalize(group), GROUP, group) for group in snapshot.groups])
+        entries = []
+        for day in days_order:
+            if not snapshot.has_day(day):
+                continue
+            for group in snapshot.groups:
+                lessons, _ = snapshot.lookup(day, group)
+                for number, lesson in enumerate(lessons or [], start=1):
+                    if not lesson:
+                        continue
+                    place = (day, group, number, lesson)
+                    subject_key = (SUBJECT, lesson.subject)
+                    if subject_key not in self.occurrences:
+                        # Предмет находится и по началу названия, и по началу любого слова в нём.
+                        words = normalize(lesson.subject).split(' ')
+                        entries += [(' '.join(words[i:]), SUBJECT, lesson.subject) for i in range(len(words))]
+                    self.occurrences.setdefault(subject_key, []).append(place)
+                    for room in re.split(r'[/,\s]+', lesson.rooms):
+                        if not room:
+                            continue
+                        if (ROOM, room) not in self.occurrences:
+                            entries.append((normalize(room), ROOM, room))
+                        self.occurrences.setdefault((ROOM, room), []).append(place)
+        self.index = PrefixIndex(entries)
+        logging.info(f"Поисковый индекс для снимка {self.version}: {len(self.groups)} групп, {len(self.index)} ключей")
+
+    def search(self, query, limit=50):
+        # Группы важнее предметов и кабинетов с тем же префиксом, поэтому идут первыми.
+        found = self.groups.search(query, limit)
+        return found + self.index.search(query, limit - len(found))
+
+    def places(self, kind, value):
+        return self.occurrences.get((kind, value), [])
+
+
+class ResultCache:
+    # Готовые ответы на запросы для одной версии снимка; при смене версии всё сбрасывается.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.snapshot = None
+        self.search = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_search(self, snapshot, days_order):
+        with self.lock:
+            if self.search is None or self.snapshot is not snapshot:
+                self.search = SnapshotSearch(snapshot, days_order)
+                self.snapshot = snapshot
+                self.entries = OrderedDict()
+            return self.search
+
+    def get(self, snapshot, key):
+        with self.lock:
+            if snapshot is not self.snapshot or key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, snapshot, key, value):
+        with self.lock:
+            if snapshot is not self.snapshot:
+                return
+            self.entries[key] = value
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import importlib
+import threading
+from datetime import datetime
+
+import metrics
+
+# Теневой режим: кандидат на замену parse_schedule_file (та же сигнатура, structured=True)
+# работает рядом с текущим парсером, результаты сравниваются по группам, расхождения и
+# время обоих парсеров пишутся в JSONL. Пользователям по-прежнему отвечает текущий парсер.
+SHADOW_PARSER = os.getenv('SHADOW_PARSER', '')
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0))
+SHADOW_LOG_PATH = os.getenv('SHADOW_LOG_PATH', os.path.join('state', 'shadow_parser.jsonl'))
+MAX_DIFFS = 20
+SAMPLE_QUEUE_SIZE = 100
+CACHED_FILES = 50
+
+metrics.describe('shadow_comparisons_total', "Сравнения кандидата парсера с текущим")
+metrics.describe('shadow_mismatches_total', "Сравнения, в которых кандидат разошёлся с текущим парсером")
+metrics.describe('shadow_samples_dropped_total', "Выборки живых запросов, отброшенные из-за полной очереди")
+
+
+def load_candidate(spec):
+    module_name, _, function_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), function_name or 'parse_schedule_file')
+
+
+def baseline_parser(file_path):
+    from parse_schedule import parse_schedule_file
+    return parse_schedule_file(file_path, structured=True)
+
+
+def lesson_key(lesson):
+    # Уроки снимка — объекты Lesson, у парсеров — пары (предмет, кабинеты).
+    if lesson is None:
+        return None
+    if isinstance(lesson, (tuple, list)):
+        return tuple(lesson)
+    return lesson.subject, lesson.rooms
+
+
+def diff_group(group, expected, actual):
+    if expected is None and actual is None:
+        return []
+    if expected is None:
+        return [{'group': group, 'kind': 'extra_group'}]
+    if actual is None:
+        return [{'group': group, 'kind': 'missing_group'}]
+    expected = [lesson_key(lesson) for lesson in expected]
+    actual = [lesson_key(lesson) for lesson in actual]
+    diffs = []
+    for number in range(max(len(expected), len(actual))):
+        left = expected[number] if number < len(expected) else None
+        right = actual[number] if number < len(actual) else None
+        if left != right:
+            diffs.append({'group': group, 'kind': 'lesson', 'number': number + 1, 'expected': left, 'actual': right})
+    return diffs
+
+
+def diff_schedules(expected, actual):
+    diffs = []
+    for group in sorted(set(expected) | set(actual)):
+        diffs += diff_group(group, expected.get(group), actual.get(group))
+    return diffs
+
+
+def timed(parser, file_path):
+    started = time.perf_counter()
+    try:
+        result = parser(file_path)
+        error = None
+    except Exception as e:
+        result, error = (None, None), f"{type(e).__name__}: {e}"
+    return result, round((time.perf_counter() - started) * 1000, 3), error
+
+
+class ShadowComparator:
+    def __init__(self, candidate, log_path=SHADOW_LOG_PATH, sample_rate=SHADOW_SAMPLE_RATE):
+        self.candidate = candidate
+        self.log_path = log_path
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.samples = queue.Queue(maxsize=SAMPLE_QUEUE_SIZE)
+        # Результат кандидата по (файл, mtime): выборки одного снимка не разбирают файл повторно.
+        self.candidate_results = {}
+        self.worker = None
+
+    def write(self, record):
+        metrics.increment('shadow_comparisons_total')
+        if record['mismatches']:
+            metrics.increment('shadow_mismatches_total')
+            logging.warning(f"Теневой парсер разошёлся с текущим ({record['mode']}, {record['file']}): "
+                            f"расхождений {record['mismatches']}")
+        directory = os.path.dirname(self.log_path)
+        with self.lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def compare_file(self, file_path, version, day):
+        (expected, expected_date), baseline_ms, baseline_error = timed(baseline_parser, file_path)
+        (actual, actual_date), candidate_ms, candidate_error = timed(self.candidate, file_path)
+        self.remember(file_path, (actual, actual_date))
+        diffs = diff_schedules(expected or {}, actual or {})
+        if expected_date != actual_date:
+            diffs.insert(0, {'kind': 'date', 'expected': expected_date, 'actual': actual_date})
+        record = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'mode': 'snapshot',
+            'version': version,
+            'day': day,
+            'file': os.path.basename(file_path),
+            'groups': len(expected or {}),
+            'mismatches': len(diffs) + bool(candidate_error),
+            'diffs': diffs[:MAX_DIFFS],
+            'baseline_ms': baseline_ms,
+            'candidate_ms': candidate_ms,
+            'speedup': round(baseline_ms / candidate_ms, 2) if candidate_ms else None,
+        }
+        if baseline_error or candidate_error:
+            record.update(baseline_error=baseline_error, candidate_error=candidate_error)
+        self.write(record)
+        return record
+
+    def cache_key(self, file_path):
+        try:
+            return file_path, os.path.getmtime(file_path)
+        except OSError:
+            return None
+
+    def remember(self, file_path, result):
+        key = self.cache_key(file_path)
+        with self.lock:
+            if len(self.candidate_results) >= CACHED_FILES:
+                self.candidate_results.clear()
+            self.candidate_results[key] = result
+
+    def compare_snapshot(self, extracted_dir, version):
+        from parse_schedule import get_schedule_files
+
+        records = [self.compare_file(file_path, version, day)
+                   for day, file_path in get_schedule_files(extracted_dir).items()]
+        baseline_ms = sum(record['baseline_ms'] for record in records)
+        candidate_ms = sum(record['candidate_ms'] for record in records)
+        mismatches = sum(record['mismatches'] for record in records)
+        logging.info(f"Теневой парсер на снимке {version}: файлов {len(records)}, расхождений {mismatches}, "
+                     f"время {candidate_ms:.1f} мс против {baseline_ms:.1f} мс у текущего")
+        return records
+
+    def enqueue(self, snapshot, day, group_id, lessons):
+        try:
+            self.samples.put_nowait((snapshot.extracted_dir, snapshot.version, day, group_id, lessons))
+        except queue.Full:
+            metrics.increment('shadow_samples_dropped_total')
+            return
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run_samples, daemon=True)
+                self.worker.start()
+
+    def check_sample(self, extracted_dir, version, day, group_id, lessons):
+        from parse_schedule import get_schedule_files
+
+        file_path = get_schedule_files(extracted_dir).get(day)
+        if not file_path:
+            return None
+        with self.lock:
+            cached = self.candidate_results.get(self.cache_key(file_path))
+        candidate_ms = None
+        if cached is None:
+            cached, candidate_ms, _ = timed(self.candidate, file_path)
+            self.remember(file_path, cached)
+        actual = (cached[0] or {}).get(group_id)
+        # Пустой день группы снимок отдаёт как None, как и отсутствующую группу.
+        if actual is not None and not any(lesson_key(lesson) != ('', '') for lesson in actual):
+            actual = None
+        diffs = diff_group(group_id, lessons, actual)
+        record = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'mode': 'lookup',
+            'version': version,
+            'day': day,
+            'file': os.path.basename(file_path),
+            'group': group_id,
+            'mismatches': len(diffs),
+            'diffs': diffs[:MAX_DIFFS],
+            'candidate_ms': candidate_ms,
+        }
+        self.write(record)
+        return record
+
+    def run_samples(self):
+        while True:
+            item = self.samples.get()
+            try:
+                self.check_sample(*item)
+            except Exception as e:
+                logging.error(f"Ошибка теневого сравнения выборки: {e}")
+
+
+comparator = None
+if SHADOW_PARSER:
+    try:
+        comparator = ShadowComparator(load_candidate(SHADOW_PARSER))
+        logging.info(f"Теневой парсер: {SHADOW_PARSER}, доля живых запросов {SHADOW_SAMPLE_RATE}")
+    except Exception as e:
+        logging.error(f"Не удалось загрузить теневой парсер {SHADOW_PARSER}: {e}")
+
+
+def compare_published(snapshot):
+    # Полное сравнение каждого опубликованного снимка, в фоне, чтобы не задерживать публикацию.
+    if comparator is None:
+        return
+    threading.Thread(target=comparator.compare_snapshot, args=(snapshot.extracted_dir, snapshot.version),
+                     daemon=True).start()
+
+
+def sample_view(snapshot, day, group_id):
+    # Только просмотры пользователей из обработчиков бота: массовые чтения снимка (поиск,
+    # календарь, API, прогрев отрисовок) не должны занимать очередь выборок.
+    if comparator is None or random.random() >= comparator.sample_rate or not snapshot.has_day(day):
+        return
+    lessons, _ = snapshot.lookup(day, group_id)
+    comparator.enqueue(snapshot, day, group_id, lessons)
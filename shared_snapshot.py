@@ -0,0 +1,127 @@
+import os
+import json
+import mmap
+import struct
+import logging
+from schedule_model import Lesson
+
+MAPPED_FILE = "schedule.bin"
+MAGIC = b'MGKS'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHHHHI')
+ENTRY = struct.Struct('<II')
+ABSENT = 0xFFFFFFFF
+LESSON_SEPARATOR = '\x1f'
+FIELD_SEPARATOR = '\x1e'
+
+# Формат файла:
+#   заголовок (HEADER) | метаданные JSON | таблица смещений days x groups (ENTRY) | уроки
+# Уроки одной пары (день, группа) хранятся как UTF-8 строки, разделённые LESSON_SEPARATOR,
+# предмет и кабинеты внутри урока — через FIELD_SEPARATOR.
+# Файл отображается в память только для чтения, поэтому все воркеры делят одни страницы.
+
+
+def write_mapped_schedule(snapshot, path):
+    days = list(snapshot.days)
+    groups = list(snapshot.groups)
+    group_index = {group: idx for idx, group in enumerate(groups)}
+    meta = json.dumps({
+        'version': snapshot.version,
+        'days': days,
+        'dates': [snapshot.dates.get(day) for day in days],
+        'groups': groups,
+    }, ensure_ascii=False).encode('utf-8')
+
+    table = [(ABSENT, 0)] * (len(days) * len(groups))
+    payload = bytearray()
+    for day_idx, day in enumerate(days):
+        for group, lessons in snapshot.days[day].items():
+            if group not in group_index:
+                continue
+            data = LESSON_SEPARATOR.join(
+                f"{lesson.subject}{FIELD_SEPARATOR}{lesson.rooms}" for lesson in lessons).encode('utf-8')
+            table[day_idx * len(groups) + group_index[group]] = (len(payload), len(data))
+            payload += data
+
+    tmp_path = f"{path}.part"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(days), len(groups), 0, len(meta)))
+        f.write(meta)
+        for offset, length in table:
+            f.write(ENTRY.pack(offset, length))
+        f.write(payload)
+    os.replace(tmp_path, path)
+    logging.info(f"Записан разделяемый файл расписания {path}: {len(days)} дней, {len(groups)} групп, {len(payload)} байт уроков")
+    return path
+
+
+def write_for_build(build):
+    from snapshot_store import Snapshot
+
+    snapshot = Snapshot.load(build.version, build.path)
+    return write_mapped_schedule(snapshot, os.path.join(build.path, MAPPED_FILE))
+
+
+class MappedSnapshot:
+    # Тот же интерфейс чтения, что и у snapshot_store.Snapshot, но данные уроков
+    # остаются в отображённом файле и декодируются только при обращении.
+    __slots__ = ('version', 'path', 'dates', 'groups', '_days', '_group_index', '_map', '_table_offset',
+                 '_payload_offset')
+
+    def __init__(self, version, path, file_path):
+        with open(file_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, n_days, n_groups, _, meta_len = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            mapped.close()
+            raise ValueError(f"Неподдерживаемый формат файла {file_path}")
+        meta = json.loads(mapped[HEADER.size:HEADER.size + meta_len].decode('utf-8'))
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'dates', dict(zip(meta['days'], meta['dates'])))
+        object.__setattr__(self, 'groups', tuple(meta['groups']))
+        object.__setattr__(self, '_days', {day: idx for idx, day in enumerate(meta['days'])})
+        object.__setattr__(self, '_group_index', {group: idx for idx, group in enumerate(meta['groups'])})
+        object.__setattr__(self, '_map', mapped)
+        object.__setattr__(self, '_table_offset', HEADER.size + meta_len)
+        object.__setattr__(self, '_payload_offset', HEADER.size + meta_len + ENTRY.size * n_days * n_groups)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MappedSnapshot неизменяем")
+
+    @property
+    def extracted_dir(self):
+        from snapshot_store import EXTRACTED_SUBDIR
+        return os.path.join(self.path, EXTRACTED_SUBDIR)
+
+    @property
+    def downloaded_dir(self):
+        from snapshot_store import DOWNLOADED_SUBDIR
+        return os.path.join(self.path, DOWNLOADED_SUBDIR)
+
+    def has_day(self, day):
+        return day in self._days
+
+    def lookup(self, day, group_id):
+        date = self.dates.get(day)
+        day_idx = self._days.get(day)
+        group_idx = self._group_index.get(group_id.strip())
+        if day_idx is None or group_idx is None:
+            return None, date
+        entry_pos = self._table_offset + ENTRY.size * (day_idx * len(self.groups) + group_idx)
+        offset, length = ENTRY.unpack_from(self._map, entry_pos)
+        if offset == ABSENT:
+            return None, date
+        start = self._payload_offset + offset
+        lessons = [Lesson(*item.split(FIELD_SEPARATOR, 1))
+                   for item in self._map[start:start + length].decode('utf-8').split(LESSON_SEPARATOR)]
+        if any(lessons):
+            return lessons, date
+        return None, date
+
+    @classmethod
+    def load(cls, version, path):
+        file_path = os.path.join(path, MAPPED_FILE)
+        snapshot = cls(version, path, file_path)
+        logging.info(f"Отображён в память снимок расписания {version}: {len(snapshot._days)} дней, {len(snapshot.groups)} групп")
+        return snapshot
@@ -0,0 +1,302 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from types import MappingProxyType
+from schedule_model import DaySchedule, LessonPool
+
+SNAPSHOTS_DIR = os.getenv('SNAPSHOTS_DIR', 'snapshots')
+KEEP_VERSIONS = int(os.getenv('SNAPSHOT_KEEP_VERSIONS', 3))
+CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', 5))
+SNAPSHOT_BACKEND = os.getenv('SNAPSHOT_BACKEND', 'memory')
+LEGACY_EXTRACTED_DIR = "extracted_schedules"
+
+CURRENT_LINK = "current"
+BUILD_PREFIX = ".build-"
+DOWNLOADED_SUBDIR = "downloaded_schedules"
+EXTRACTED_SUBDIR = "extracted_schedules"
+STALE_BUILD_SECONDS = 3600
+
+
+class Snapshot:
+    # Неизменяемый срез расписания: читатели держат ссылку на объект целиком,
+    # а публикация новой версии просто подменяет указатель.
+    # Уроки хранятся в компактном виде (schedule_model): общие таблицы предметов и кабинетов
+    # и колонки идентификаторов по группам; строки для пользователя собираются при отображении.
+    __slots__ = ('version', 'path', 'days', 'dates', 'groups')
+
+    def __init__(self, version, path, days, groups):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'days', MappingProxyType(dict(days)))
+        object.__setattr__(self, 'dates', MappingProxyType({day: d.date for day, d in days.items()}))
+        object.__setattr__(self, 'groups', tuple(groups))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot неизменяем")
+
+    def has_day(self, day):
+        return day in self.days
+
+    def lookup(self, day, group_id):
+        date = self.dates.get(day)
+        day_schedule = self.days.get(day)
+        lessons = day_schedule.get(group_id.strip()) if day_schedule else None
+        if lessons and any(lessons):
+            return list(lessons), date
+        return None, date
+
+    @property
+    def extracted_dir(self):
+        return os.path.join(self.path, EXTRACTED_SUBDIR) if self.version else self.path
+
+    @property
+    def downloaded_dir(self):
+        return os.path.join(self.path, DOWNLOADED_SUBDIR) if self.version else None
+
+    @classmethod
+    def load(cls, version, path):
+        from parse_schedule import get_schedule_files, parse_schedule_file, sort_groups
+
+        extracted_dir = os.path.join(path, EXTRACTED_SUBDIR) if version else path
+        pool = LessonPool()
+        days = {}
+        groups = set()
+        for day, file_path in get_schedule_files(extracted_dir).items():
+            day_schedules, date = parse_schedule_file(file_path, structured=True)
+            if day_schedules is None:
+                continue
+            days[day] = DaySchedule.from_groups(pool, date, day_schedules)
+            groups.update(day_schedules)
+        logging.info(f"Загружен снимок расписания {version or path}: {len(days)} дней, {len(groups)} групп, {len(pool.subjects)} предметов, {len(pool.rooms)} кабинетов")
+        return cls(version, path, days, sort_groups(groups))
+
+
+def published_at(snapshot):
+    if snapshot.version:
+        try:
+            return datetime.strptime(snapshot.version, '%Y%m%dT%H%M%S%f')
+        except ValueError:
+            pass
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(snapshot.extracted_dir))
+    except OSError:
+        return datetime.now()
+
+
+class Build:
+    def __init__(self, version, path):
+        self.version = version
+        self.path = path
+        self.downloaded_dir = os.path.join(path, DOWNLOADED_SUBDIR)
+        self.extracted_dir = os.path.join(path, EXTRACTED_SUBDIR)
+
+    def has_extracted_files(self):
+        return os.path.isdir(self.extracted_dir) and any(
+            f.endswith('.txt') for f in os.listdir(self.extracted_dir))
+
+
+class SnapshotStore:
+    def __init__(self, root=SNAPSHOTS_DIR, keep_versions=KEEP_VERSIONS, legacy_dir=None):
+        self.root = root
+        self.keep_versions = max(1, keep_versions)
+        self.legacy_dir = legacy_dir
+        # Текущий загруженный снимок этого хранилища и время последней проверки ссылки current.
+        self._current_snapshot = None
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def current_link(self):
+        return os.path.join(self.root, CURRENT_LINK)
+
+    def version_path(self, version):
+        return os.path.join(self.root, version)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if not name.startswith('.') and name != CURRENT_LINK
+            and os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def current_version(self):
+        try:
+            return os.path.basename(os.readlink(self.current_link))
+        except OSError:
+            return None
+
+    def new_build(self, seed=True):
+        os.makedirs(self.root, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        build = Build(version, os.path.join(self.root, BUILD_PREFIX + version))
+        os.makedirs(build.downloaded_dir)
+        os.makedirs(build.extracted_dir)
+        current = self.current_version()
+        if seed and current:
+            # Дни, которых больше нет на сайте, переносятся из прошлой версии.
+            # Жёсткие ссылки безопасны: загрузчик пишет через временный файл и os.replace.
+            source_dir = os.path.join(self.version_path(current), DOWNLOADED_SUBDIR)
+            if os.path.isdir(source_dir):
+                for name in os.listdir(source_dir):
+                    src = os.path.join(source_dir, name)
+                    dst = os.path.join(build.downloaded_dir, name)
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        shutil.copy2(src, dst)
+        logging.info(f"Создана сборка снимка {version} в {build.path}")
+        return build
+
+    def discard(self, build):
+        shutil.rmtree(build.path, ignore_errors=True)
+        logging.info(f"Сборка {build.version} отброшена")
+
+    def _point_current_to(self, version):
+        tmp_link = os.path.join(self.root, f".{CURRENT_LINK}-{os.getpid()}-{threading.get_ident()}")
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(version, tmp_link)
+        os.replace(tmp_link, self.current_link)
+
+    def publish(self, build):
+        final_path = self.version_path(build.version)
+        os.rename(build.path, final_path)
+        self._point_current_to(build.version)
+        logging.info(f"Опубликован снимок расписания {build.version}")
+        self.collect_garbage()
+        return build.version
+
+    def rollback(self, version=None):
+        versions = self.versions()
+        current = self.current_version()
+        if version is None:
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                logging.error("Нет более старой версии для отката")
+                return None
+            version = older[-1]
+        elif version not in versions:
+            logging.error(f"Версия {version} не найдена в {self.root}")
+            return None
+        self._point_current_to(version)
+        logging.info(f"Откат снимка расписания: {current} -> {version}")
+        return version
+
+    def collect_garbage(self):
+        versions = self.versions()
+        current = self.current_version()
+        keep = set(versions[-self.keep_versions:])
+        if current:
+            keep.add(current)
+        removed = []
+        for version in versions:
+            if version not in keep:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
+                removed.append(version)
+        now = time.time()
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            path = os.path.join(self.root, name)
+            if name.startswith(BUILD_PREFIX) and now - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(name)
+        if removed:
+            logging.info(f"Удалены старые версии снимков: {removed}")
+        return removed
+
+    def load_current(self):
+        version = self.current_version()
+        if version:
+            path = self.version_path(version)
+            if SNAPSHOT_BACKEND == 'mmap':
+                from shared_snapshot import MAPPED_FILE, MappedSnapshot
+                if os.path.exists(os.path.join(path, MAPPED_FILE)):
+                    return MappedSnapshot.load(version, path)
+                logging.warning(f"В снимке {version} нет {MAPPED_FILE}, загружаем расписание в память процесса")
+            return Snapshot.load(version, path)
+        if self.legacy_dir:
+            return Snapshot.load(None, self.legacy_dir)
+        return Snapshot(None, self.root, {}, [])
+
+    def add_listener(self, callback):
+        # Вызывается один раз для каждой новой версии, которую подхватил этот процесс.
+        self._listeners.append(callback)
+
+    def _notify_listeners(self, snapshot):
+        for callback in list(self._listeners):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике нового снимка {getattr(callback, '__name__', callback)}: {e}")
+
+    def refresh_snapshot(self, force=False):
+        if not self._reload_lock.acquire(blocking=force or self._current_snapshot is None):
+            return self._current_snapshot
+        try:
+            self._checked_at = time.monotonic()
+            snapshot = self._current_snapshot
+            if force or snapshot is None or snapshot.version != self.current_version():
+                self._current_snapshot = self.load_current()
+                self._notify_listeners(self._current_snapshot)
+            return self._current_snapshot
+        finally:
+            self._reload_lock.release()
+
+    def get_snapshot(self):
+        snapshot = self._current_snapshot
+        if snapshot is None or time.monotonic() - self._checked_at > CHECK_INTERVAL:
+            return self.refresh_snapshot()
+        return snapshot
+
+
+default_store = SnapshotStore(legacy_dir=LEGACY_EXTRACTED_DIR)
+
+
+def add_snapshot_listener(callback):
+    default_store.add_listener(callback)
+
+
+def refresh_snapshot(force=False):
+    return default_store.refresh_snapshot(force)
+
+
+def get_snapshot():
+    return default_store.get_snapshot()
+
+
+def watch_snapshots(stop_event=None, interval=CHECK_INTERVAL, stores=None):
+    # Ведомые экземпляры не обновляют расписание сами, а подхватывают снимки, опубликованные лидером.
+    stop_event = stop_event or threading.Event()
+    stores = stores or [default_store]
+    while not stop_event.is_set():
+        for store in stores:
+            previous = store._current_snapshot.version if store._current_snapshot else None
+            try:
+                snapshot = store.refresh_snapshot()
+                if snapshot and snapshot.version != previous:
+                    logging.info(f"Подхвачен снимок расписания {snapshot.version} из {store.root}")
+            except Exception as e:
+                logging.error(f"Ошибка при загрузке снимка расписания из {store.root}: {e}")
+        stop_event.wait(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        current = default_store.current_version()
+        for version in default_store.versions():
+            print(f"{'*' if version == current else ' '} {version}")
+    elif command == "rollback":
+        default_store.rollback(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif command == "gc":
+        default_store.collect_garbage()
+    else:
+        print("Использование: python snapshot_store.py [list|rollback [версия]|gc]")
+        sys.exit(1)
@@ -0,0 +1,104 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from snapshot_store import SNAPSHOTS_DIR, SnapshotStore, default_store
+from schedule_archive import ARCHIVE_DIR, ScheduleArchive
+from refresh_scheduler import POLL_PERIODS
+from get_schedule import SITE_URL
+
+SOURCES_CONFIG = os.getenv('SOURCES_CONFIG', 'sources.json')
+# Сколько скачиваний и конвертаций может идти одновременно на все источники вместе.
+REFRESH_WORKERS = max(1, int(os.getenv('REFRESH_WORKERS', 2)))
+DEFAULT_SOURCE = {'key': 'mgktdlp', 'title': 'МГКТДЛП', 'url': SITE_URL}
+SOURCES_SUBDIR = ".sources"
+
+worker_budget = threading.BoundedSemaphore(REFRESH_WORKERS)
+
+
+class Source:
+    # Одно учебное заведение: своя страница с расписанием, свои снимки, архив и частота опроса.
+    def __init__(self, key, title, site_url, store, archive_dir, poll_periods=None):
+        self.key = key
+        self.title = title
+        self.site_url = site_url
+        self.store = store
+        self.archive_dir = archive_dir
+        self.poll_periods = poll_periods or POLL_PERIODS
+        self.archive = ScheduleArchive(archive_dir)
+
+    @property
+    def libreoffice_profile_dir(self):
+        # Отдельный профиль libreoffice, чтобы конвертации разных источников не мешали друг другу.
+        return os.path.abspath(os.path.join(self.store.root, '.libreoffice'))
+
+    def script_env(self):
+        return {
+            'SCHEDULE_ARCHIVE_DIR': self.archive_dir,
+            'LIBREOFFICE_PROFILE_DIR': self.libreoffice_profile_dir,
+        }
+
+    def get_snapshot(self):
+        return self.store.get_snapshot()
+
+
+def source_from_config(entry, index):
+    key = entry['key']
+    if index == 0:
+        # Первый источник живёт в прежних путях, чтобы уже опубликованные снимки и архив сохранились.
+        store = default_store
+        archive_dir = ARCHIVE_DIR
+    else:
+        root = entry.get('root') or os.path.join(SNAPSHOTS_DIR, SOURCES_SUBDIR, key)
+        store = SnapshotStore(root)
+        archive_dir = os.path.join(root, '.archive')
+    periods = [tuple(period) for period in entry['poll_periods']] if entry.get('poll_periods') else None
+    return Source(key, entry.get('title') or key, entry['url'], store, archive_dir, periods)
+
+
+def load_sources(path=SOURCES_CONFIG):
+    entries = [DEFAULT_SOURCE]
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)['sources'] or entries
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Ошибка чтения {path}: {e}, используется один источник по умолчанию")
+    sources = OrderedDict()
+    for index, entry in enumerate(entries):
+        source = source_from_config(entry, index)
+        if source.key in sources:
+            logging.error(f"Источник {source.key} указан в {path} дважды, повтор пропущен")
+            continue
+        sources[source.key] = source
+    logging.info(f"Источники расписания: {', '.join(sources)}")
+    return sources
+
+
+_sources = None
+_sources_lock = threading.Lock()
+
+
+def all_sources():
+    # Конфигурация читается при первом обращении, а не при импорте: импорт модуля не должен
+    # писать в лог раньше, чем main настроит logging.
+    global _sources
+    if _sources is None:
+        with _sources_lock:
+            if _sources is None:
+                _sources = load_sources()
+    return _sources
+
+
+def default_source():
+    return next(iter(all_sources().values()))
+
+
+def get_source(key):
+    return all_sources().get(key) or default_source()
+
+
+def is_multi_source():
+    return len(all_sources()) > 1
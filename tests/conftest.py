@@ -0,0 +1,20 @@
+import os
+import sys
+
+# Модули бота лежат в корне репозитория, а не в пакете.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCHEDULE_TEXT = """Расписание занятий на {date}
+│401│402│
+├───┼───┤
+│1 Физика 230│1 Химия 287│
+│2 Математика 295│2 История 161│
+"""
+
+
+def write_schedule(folder, name='rasp_monday.txt', date='20.10.2025'):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(SCHEDULE_TEXT.format(date=date))
+    return path
@@ -0,0 +1,33 @@
+from datetime import date
+
+from analytics import Aggregates, HyperLogLog
+
+
+def test_hyperloglog_estimate_and_merge():
+    first, second = HyperLogLog(), HyperLogLog()
+    for user_id in range(20000):
+        first.add(user_id)
+    for user_id in range(10000, 30000):
+        second.add(user_id)
+    assert abs(first.estimate() - 20000) < 20000 * 0.1
+    first.merge(second)
+    assert abs(first.estimate() - 30000) < 30000 * 0.1
+    assert HyperLogLog.from_json(first.to_json()).registers == first.registers
+
+
+def test_hyperloglog_small_counts():
+    sketch = HyperLogLog()
+    for _ in range(3):
+        for user_id in range(5):
+            sketch.add(user_id)
+    assert sketch.estimate() == 5
+
+
+def test_day_users_expire_by_calendar_date():
+    aggregates = Aggregates()
+    for key in ('2025-07-01', '2025-10-01', '2025-10-20', 'Понедельник'):
+        aggregates.sketch(aggregates.day_users, key).add(1)
+    aggregates.expire_days(date(2025, 10, 20), retention=30)
+    assert sorted(aggregates.day_users) == ['2025-10-01', '2025-10-20']
+    restored = Aggregates.from_json(aggregates.to_json())
+    assert sorted(restored.day_users) == ['2025-10-01', '2025-10-20']
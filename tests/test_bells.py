@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from bells import JUNIOR, SENIOR, bells_at, course_group_for
+
+
+def at(hour, minute):
+    return datetime(2025, 10, 20, hour, minute)
+
+
+def test_current_lesson_and_break():
+    current, upcoming = bells_at(at(8, 40))
+    assert current.number == 1
+    assert upcoming[0].number == 2
+
+    current, upcoming = bells_at(at(9, 20))
+    assert current is None
+    assert upcoming[0].number == 2
+
+
+def test_before_and_after_lessons():
+    current, upcoming = bells_at(at(7, 0))
+    assert current is None and upcoming[0].number == 1
+    current, upcoming = bells_at(at(19, 0))
+    assert current is None and upcoming == []
+
+
+def test_fifth_lesson_depends_on_course():
+    assert bells_at(at(12, 20), SENIOR)[0].number == 5
+    assert bells_at(at(12, 20), JUNIOR)[0] is None
+    assert bells_at(at(13, 0), JUNIOR)[0].number == 5
+    assert course_group_for('401') == SENIOR
+    assert course_group_for('145') == JUNIOR
@@ -0,0 +1,22 @@
+from digest import MINUTES_PER_DAY, DigestWheel, parse_digest_time
+
+
+def test_parse_digest_time():
+    assert parse_digest_time('20:00') == 20 * 60
+    assert parse_digest_time(' 7.05 ') == 7 * 60 + 5
+    assert parse_digest_time('24:00') is None
+    assert parse_digest_time('завтра') is None
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = DigestWheel()
+    wheel.schedule(1, 600)
+    wheel.schedule(2, 600)
+    wheel.schedule(1, 601)
+    assert wheel.due(600) == [2]
+    assert wheel.due(601) == [1]
+    assert wheel.due(601 + MINUTES_PER_DAY) == [1]
+    wheel.cancel(2)
+    wheel.cancel(3)
+    assert wheel.due(600) == []
+    assert len(wheel) == 1
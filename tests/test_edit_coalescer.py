@@ -0,0 +1,48 @@
+import time
+import threading
+
+from edit_coalescer import EditCoalescer
+
+
+def test_pending_edit_is_replaced_by_newer():
+    queue = EditCoalescer(workers=1)
+    sent = []
+    release = threading.Event()
+
+    def first():
+        release.wait(5)
+        sent.append('first')
+
+    queue.submit((1, 10), first)
+    while not queue.in_flight:
+        time.sleep(0.01)
+    # Пока первая правка отправляется, две следующие схлопываются в последнюю.
+    queue.submit((1, 10), lambda: sent.append('second'))
+    queue.submit((1, 10), lambda: sent.append('third'))
+    release.set()
+    queue.wait_chat(1, timeout=5)
+    assert sent == ['first', 'third']
+
+
+def test_wait_chat_waits_only_for_its_chat():
+    queue = EditCoalescer(workers=2)
+    release = threading.Event()
+    queue.submit((2, 20), lambda: release.wait(5))
+    queue.wait_chat(1, timeout=0.1)
+    assert queue.busy(2)
+    release.set()
+    queue.wait_chat(2, timeout=5)
+    assert not queue.busy(2)
+
+
+def test_error_is_reported_once():
+    queue = EditCoalescer(workers=1)
+    errors = []
+    reported = threading.Event()
+
+    def fail():
+        raise RuntimeError('boom')
+
+    queue.submit((3, 30), fail, lambda e: (errors.append(str(e)), reported.set()))
+    assert reported.wait(5)
+    assert errors == ['boom']
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import leader_lease
+from leader_lease import LeaderLease
+
+
+@pytest.fixture(params=['leader.sqlite3', 'leader.json'])
+def lease_path(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(leader_lease.FileLeaseBackend, 'VERIFY_DELAY', 0)
+    return str(tmp_path / request.param)
+
+
+def test_only_one_holder(lease_path):
+    first = LeaderLease(lease_path, ttl=30, holder_id='first')
+    second = LeaderLease(lease_path, ttl=30, holder_id='second')
+    assert first.try_acquire()
+    assert first.is_leader
+    assert not second.try_acquire()
+    assert not second.is_leader
+    assert second.current_holder() == 'first'
+    # Продление своей аренды проходит.
+    assert first.try_acquire()
+
+
+def test_takeover_after_expiry(lease_path):
+    first = LeaderLease(lease_path, ttl=1.0, holder_id='first')
+    second = LeaderLease(lease_path, ttl=1.0, holder_id='second')
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    # Лидер «умер» без release: аренда переходит только после истечения TTL.
+    time.sleep(1.1)
+    assert first.current_holder() is None
+    assert second.try_acquire()
+    assert second.current_holder() == 'second'
+    assert not first.try_acquire()
+    assert not first.is_leader
+
+
+def test_release_allows_immediate_takeover(lease_path):
+    first = LeaderLease(lease_path, ttl=30, holder_id='first')
+    second = LeaderLease(lease_path, ttl=30, holder_id='second')
+    assert first.try_acquire()
+    first.release()
+    assert not first.is_leader
+    assert second.try_acquire()
+
+
+def test_is_leader_expires_before_lease(lease_path):
+    lease = LeaderLease(lease_path, ttl=3.0, holder_id='first')
+    assert lease.try_acquire()
+    time.sleep(2.1)
+    # Запас в треть TTL: лидерство снимается раньше, чем аренду может перехватить другой.
+    assert not lease.is_leader
+    assert lease.current_holder() == 'first'
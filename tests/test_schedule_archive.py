@@ -0,0 +1,60 @@
+import os
+from datetime import date
+
+import pytest
+
+from schedule_archive import OBJECTS_SUBDIR, ScheduleArchive
+from conftest import write_schedule
+
+
+def object_files(archive):
+    return sorted(name for _, _, names in os.walk(os.path.join(archive.root, OBJECTS_SUBDIR)) for name in names)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ScheduleArchive(str(tmp_path / 'archive'), retention_days=30)
+
+
+def test_same_document_is_stored_once(archive):
+    first = archive.put_document(date(2025, 10, 20), b'same', '.doc', 'monday.doc')
+    second = archive.put_document(date(2025, 10, 27), b'same', '.doc', 'monday.doc')
+    assert first == second
+    assert archive.dates() == [date(2025, 10, 20), date(2025, 10, 27)]
+    assert object_files(archive) == [f'{first}.doc']
+
+
+def test_text_is_parsed_by_date(archive, tmp_path):
+    doc = archive.put_document(date(2025, 10, 20), b'doc', '.doc', 'monday.doc')
+    assert archive.load_schedules(date(2025, 10, 20)) == (None, None)
+    archive.put_text(doc, write_schedule(str(tmp_path / 'txt')))
+    day_schedule, schedule_date = archive.load_schedules(date(2025, 10, 20))
+    assert schedule_date == '20.10.2025'
+    assert day_schedule.get('402')[1].subject == 'История'
+
+
+def test_failed_documents_stop_being_pending(archive, tmp_path):
+    doc = archive.put_document(date(2025, 10, 20), b'broken', '.doc', 'monday.doc')
+    assert [key for key, _ in archive.pending_documents(max_attempts=2)] == ['2025-10-20']
+    archive.mark_failed(doc)
+    assert archive.mark_failed(doc) == 2
+    assert archive.pending_documents(max_attempts=2) == []
+    # Удачное извлечение сбрасывает счётчик неудач.
+    archive.put_text(doc, write_schedule(str(tmp_path / 'txt')))
+    assert archive.load_index()['failed'] == {}
+
+
+def test_retention_removes_expired_dates_and_orphan_objects(archive, tmp_path):
+    old = archive.put_document(date(2025, 8, 1), b'old', '.doc', 'old.doc')
+    shared = archive.put_document(date(2025, 8, 2), b'shared', '.doc', 'shared.doc')
+    archive.put_document(date(2025, 10, 20), b'shared', '.doc', 'shared.doc')
+    archive.put_text(old, write_schedule(str(tmp_path / 'txt')))
+    archive.mark_failed(old)
+
+    expired = archive.apply_retention(today=date(2025, 10, 21))
+    assert expired == ['2025-08-01', '2025-08-02']
+    assert archive.dates() == [date(2025, 10, 20)]
+    index = archive.load_index()
+    assert index['texts'] == {} and index['failed'] == {}
+    # Объект, на который ещё ссылается живая дата, остаётся; текст удалённой даты — нет.
+    assert object_files(archive) == [f'{shared}.doc']
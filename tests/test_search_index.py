@@ -0,0 +1,16 @@
+from search_index import GROUP, ROOM, SUBJECT, PrefixIndex
+
+
+def test_prefix_search_is_normalized_and_deduplicated():
+    index = PrefixIndex([
+        ('физика', SUBJECT, 'Физика'),
+        ('физ. культура', SUBJECT, 'Физ. культура'),
+        ('физика', SUBJECT, 'Физика'),
+        ('401', GROUP, '401'),
+        ('401', ROOM, '401'),
+    ])
+    assert index.search('  ФИЗ ') == [(SUBJECT, 'Физ. культура'), (SUBJECT, 'Физика')]
+    assert index.search('40') == [(GROUP, '401'), (ROOM, '401')]
+    assert index.search('физ', limit=1) == [(SUBJECT, 'Физ. культура')]
+    assert index.search('') == []
+    assert index.search('химия') == []
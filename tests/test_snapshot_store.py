@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+import snapshot_store
+from snapshot_store import SnapshotStore
+from conftest import write_schedule
+
+
+def publish(store, day_file='rasp_monday.txt', date='20.10.2025'):
+    build = store.new_build()
+    write_schedule(build.extracted_dir, day_file, date)
+    return store.publish(build)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / 'snapshots'), keep_versions=2)
+
+
+def test_publish_switches_current_and_loads_snapshot(store):
+    seen = []
+    store.add_listener(lambda snapshot: seen.append(snapshot.version))
+    version = publish(store)
+    assert store.current_version() == version
+    assert not any(name.startswith(snapshot_store.BUILD_PREFIX) for name in os.listdir(store.root))
+
+    snapshot = store.refresh_snapshot(force=True)
+    assert snapshot.version == version
+    assert list(snapshot.groups) == ['402', '401']
+    lessons, date = snapshot.lookup('Понедельник', '401')
+    assert date == '20.10.2025'
+    assert lessons[0].subject == 'Физика'
+    # Та же версия второй раз не перезагружается и слушателей не будит.
+    store.refresh_snapshot()
+    assert seen == [version]
+
+
+def test_new_build_seeds_downloads_from_current(store):
+    build = store.new_build()
+    with open(os.path.join(build.downloaded_dir, 'monday.doc'), 'wb') as f:
+        f.write(b'doc')
+    write_schedule(build.extracted_dir)
+    store.publish(build)
+
+    next_build = store.new_build()
+    assert os.listdir(next_build.downloaded_dir) == ['monday.doc']
+    assert os.listdir(next_build.extracted_dir) == []
+    assert os.listdir(store.new_build(seed=False).downloaded_dir) == []
+
+
+def test_rollback_to_previous_and_explicit_version(store):
+    first = publish(store, date='20.10.2025')
+    second = publish(store, date='27.10.2025')
+    assert store.rollback() == first
+    assert store.current_version() == first
+    assert store.refresh_snapshot(force=True).dates['Понедельник'] == '20.10.2025'
+
+    assert store.rollback(second) == second
+    assert store.rollback('19990101T000000000000') is None
+    assert store.current_version() == second
+
+
+def test_rollback_without_older_version(store):
+    only = publish(store)
+    assert store.rollback() is None
+    assert store.current_version() == only
+
+
+def test_gc_keeps_recent_versions_and_current(store):
+    versions = [publish(store) for _ in range(4)]
+    assert store.versions() == versions[-2:]
+
+    # Откаченная текущая версия переживает сборку мусора, даже если она старше лимита.
+    store.rollback(versions[-2])
+    store.keep_versions = 1
+    assert store.collect_garbage() == []
+    assert store.versions() == versions[-2:]
+    publish(store)
+    assert store.versions() == [store.current_version()]
+
+
+def test_gc_removes_only_stale_builds(store):
+    publish(store)
+    stale = store.new_build()
+    fresh = store.new_build()
+    old = time.time() - snapshot_store.STALE_BUILD_SECONDS - 60
+    os.utime(stale.path, (old, old))
+    removed = store.collect_garbage()
+    assert os.path.basename(stale.path) in removed
+    assert not os.path.exists(stale.path)
+    assert os.path.exists(fresh.path)
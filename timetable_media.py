@@ -0,0 +1,234 @@
+import io
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot_store import DOWNLOADED_SUBDIR
+
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', 2))
+MEDIA_RENDER_TIMEOUT = 30
+TIMETABLE_FONT = os.getenv('TIMETABLE_FONT', '')
+FONT_CANDIDATES = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+]
+DOCUMENT_NAMES = ['rasp_monday', 'rasp_tuesday', 'rasp_wednesday', 'rasp_thursday', 'rasp_friday', 'rasp_saturday']
+DOCUMENT_EXTENSIONS = ('.docx', '.doc')
+
+# Оформление картинки недели.
+CELL_WIDTH = 230
+NUMBER_WIDTH = 40
+HEADER_HEIGHT = 56
+LINE_HEIGHT = 20
+CELL_PADDING = 8
+FONT_SIZE = 15
+BACKGROUND = (255, 255, 255)
+HEADER_BACKGROUND = (232, 240, 254)
+GRID = (200, 200, 200)
+TEXT = (33, 33, 33)
+MUTED = (150, 150, 150)
+
+_executor = None
+_executor_lock = threading.Lock()
+_fonts = {}
+
+
+def executor():
+    # Пул создаётся при первой отрисовке, а не при импорте.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix='media')
+        return _executor
+
+
+def load_font(size=FONT_SIZE, bold=False):
+    from PIL import ImageFont
+
+    key = (size, bold)
+    if key not in _fonts:
+        paths = [TIMETABLE_FONT] if TIMETABLE_FONT else []
+        paths += [path.replace('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf') for path in FONT_CANDIDATES if bold]
+        paths += FONT_CANDIDATES
+        for path in paths:
+            if path and os.path.exists(path):
+                _fonts[key] = ImageFont.truetype(path, size)
+                break
+        else:
+            logging.warning("Шрифт с кириллицей не найден, используется встроенный шрифт Pillow")
+            _fonts[key] = ImageFont.load_default()
+    return _fonts[key]
+
+
+def wrap(draw, text, font, width):
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}".strip()
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def render_week_image(snapshot, group_id, days_order):
+    # PNG-таблица недели группы: столбцы — дни снимка, строки — номера занятий.
+    from PIL import Image, ImageDraw
+
+    days = [day for day in days_order if snapshot.has_day(day)]
+    columns = []
+    for day in days:
+        lessons, date = snapshot.lookup(day, group_id)
+        columns.append((day, date, lessons or []))
+    rows = max([len(lessons) for _, _, lessons in columns] + [1])
+    font = load_font()
+    bold = load_font(bold=True)
+    measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    text_width = CELL_WIDTH - 2 * CELL_PADDING
+    cells = [[wrap(measure, f"{lesson.subject}\n{lesson.rooms} каб." if lesson.rooms else lesson.subject, font, text_width)
+              if lesson else [] for lesson in lessons] for _, _, lessons in columns]
+    heights = [
+        max([len(column[row]) for column in cells if row < len(column)] + [1]) * LINE_HEIGHT + 2 * CELL_PADDING
+        for row in range(rows)
+    ]
+    title_height = LINE_HEIGHT * 2
+    width = NUMBER_WIDTH + CELL_WIDTH * max(len(columns), 1)
+    height = title_height + HEADER_HEIGHT + sum(heights)
+    image = Image.new('RGB', (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw.text((CELL_PADDING, CELL_PADDING), f"Группа {group_id}", font=bold, fill=TEXT)
+    top = title_height
+    draw.rectangle([0, top, width, top + HEADER_HEIGHT], fill=HEADER_BACKGROUND)
+    for index, (day, date, _) in enumerate(columns):
+        left = NUMBER_WIDTH + index * CELL_WIDTH
+        draw.text((left + CELL_PADDING, top + CELL_PADDING), day, font=bold, fill=TEXT)
+        draw.text((left + CELL_PADDING, top + CELL_PADDING + LINE_HEIGHT), date or '', font=font, fill=MUTED)
+    y = top + HEADER_HEIGHT
+    for row, row_height in enumerate(heights):
+        draw.line([0, y, width, y], fill=GRID)
+        draw.text((CELL_PADDING, y + CELL_PADDING), str(row + 1), font=bold, fill=TEXT)
+        for index, column in enumerate(cells):
+            lines = column[row] if row < len(column) else []
+            left = NUMBER_WIDTH + index * CELL_WIDTH + CELL_PADDING
+            for number, line in enumerate(lines or ['—']):
+                draw.text((left, y + CELL_PADDING + number * LINE_HEIGHT), line, font=font,
+                          fill=TEXT if lines else MUTED)
+        y += row_height
+    for index in range(len(columns) + 1):
+        x = NUMBER_WIDTH + index * CELL_WIDTH
+        draw.line([x, top, x, height], fill=GRID)
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def original_document(snapshot, day, days_order):
+    # Исходный .doc/.docx колледжа из сборки снимка (у снимка без версии — из общей папки).
+    if day not in days_order or days_order.index(day) >= len(DOCUMENT_NAMES):
+        return None
+    folder = snapshot.downloaded_dir or DOWNLOADED_SUBDIR
+    for extension in DOCUMENT_EXTENSIONS:
+        path = os.path.join(folder, DOCUMENT_NAMES[days_order.index(day)] + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class Upload:
+    # Файл для отправки: после первой загрузки в Telegram хранится только его file_id.
+    # file_ids — словарь поколения снимка, для которого создана загрузка.
+    def __init__(self, file_ids, key, filename, load):
+        self.file_ids = file_ids
+        self.key = key
+        self.filename = filename
+        self.load = load
+        self.data = None
+
+    @property
+    def file_id(self):
+        return self.file_ids.get(self.key)
+
+    def read(self):
+        if self.data is None:
+            self.data = self.load()
+        return self.data
+
+    def as_file(self):
+        data = self.read()
+        if data is None:
+            return None
+        upload = io.BytesIO(data)
+        upload.name = self.filename
+        return upload
+
+    def sent(self, message):
+        # Подходит и для сообщений telebot, и для python-telegram-bot.
+        if message is None or message is True:
+            return
+        if getattr(message, 'document', None):
+            file_id = message.document.file_id
+        elif getattr(message, 'photo', None):
+            file_id = message.photo[-1].file_id
+        else:
+            return
+        self.file_ids[self.key] = file_id
+        logging.debug(f"Запомнен file_id для {self.key}")
+
+
+class MediaCache:
+    # Картинки и file_id живут столько же, сколько снимок: новый снимок — новое поколение.
+    def __init__(self, days_order):
+        self.days_order = days_order
+        self.snapshot = None
+        self.images = {}
+        self.file_ids = {}
+        self.lock = threading.Lock()
+
+    def generation(self, snapshot):
+        with self.lock:
+            if self.snapshot is not snapshot:
+                self.snapshot = snapshot
+                self.images = {}
+                self.file_ids = {}
+            return self.images, self.file_ids
+
+    def week_image(self, snapshot, group_id):
+        images, _ = self.generation(snapshot)
+        with self.lock:
+            future = images.get(group_id)
+            if future is None:
+                future = executor().submit(render_week_image, snapshot, group_id, self.days_order)
+                images[group_id] = future
+        return future
+
+    def week_upload(self, snapshot, group_id):
+        _, file_ids = self.generation(snapshot)
+
+        def load():
+            try:
+                return self.week_image(snapshot, group_id).result(timeout=MEDIA_RENDER_TIMEOUT)
+            except Exception as e:
+                logging.error(f"Ошибка отрисовки недели группы {group_id}: {e}")
+                return None
+
+        return Upload(file_ids, ('week', group_id), f"week_{group_id}.png", load)
+
+    def document_upload(self, snapshot, day):
+        _, file_ids = self.generation(snapshot)
+        path = original_document(snapshot, day, self.days_order)
+        if path is None:
+            return None
+
+        def load():
+            with open(path, 'rb') as f:
+                return f.read()
+
+        date = (snapshot.dates.get(day) or '').replace('.', '-')
+        filename = ' '.join(part for part in ('Расписание', day, date) if part) + os.path.splitext(path)[1]
+        return Upload(file_ids, ('document', day), filename, load)
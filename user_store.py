@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import logging
+import threading
+
+USER_STORE_PATH = os.getenv('USER_STORE_PATH')
+
+
+class UserStore:
+    # Выбор пользователя (группа, источник) в SQLite: общий для всех воркеров и переживает перезапуск.
+    # Имена таблицы и столбца задаются только в коде, не пользователем.
+    def __init__(self, path, table='user_groups', column='group_id'):
+        self.path = path
+        self.table = table
+        self.column = column
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (user_id INTEGER PRIMARY KEY, {column} TEXT NOT NULL)")
+        logging.info(f"Хранилище пользователей: {path} ({table})")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id, default=None):
+        row = self._connect().execute(
+            f"SELECT {self.column} FROM {self.table} WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else default
+
+    def __getitem__(self, user_id):
+        value = self.get(user_id)
+        if value is None:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id, value):
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO {self.table} (user_id, {self.column}) VALUES (?, ?) "
+                f"ON CONFLICT(user_id) DO UPDATE SET {self.column} = excluded.{self.column}",
+                (user_id, value))
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def items(self):
+        return self._connect().execute(f"SELECT user_id, {self.column} FROM {self.table}").fetchall()
+
+    def data_version(self):
+        # Меняется, когда таблицы изменило другое соединение (другой поток или процесс).
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def pop(self, user_id, default=None):
+        value = self.get(user_id, default)
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE user_id = ?", (user_id,))
+        return value
+
+
+def open_user_groups():
+    if USER_STORE_PATH:
+        return UserStore(USER_STORE_PATH)
+    return {}
+
+
+def open_user_digests():
+    if USER_STORE_PATH:
+        return UserStore(USER_STORE_PATH, table='user_digests', column='digest_time')
+    return {}
+
+
+def open_user_sources():
+    if USER_STORE_PATH:
+        return UserStore(USER_STORE_PATH, table='user_sources', column='source_key')
+    return {}
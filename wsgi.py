@@ -0,0 +1,13 @@
+import os
+
+from dotenv import load_dotenv
+
+# .env читается раньше значений по умолчанию ниже и раньше импорта модулей проекта.
+load_dotenv()
+
+# Режим пре-форк сервера: воркеры читают общий отображённый в память снимок
+# и общее хранилище пользователей вместо собственных копий.
+os.environ.setdefault('SNAPSHOT_BACKEND', 'mmap')
+os.environ.setdefault('USER_STORE_PATH', os.path.join('state', 'users.sqlite3'))
+
+from main import flask_app as application  # noqa: E402